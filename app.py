@@ -1,11 +1,21 @@
+import os
+import concurrent.futures
 import sys
 from PyQt5 import QtWidgets
 from PyQt5 import QtGui
+from PyQt5 import QtCore
 from PyQt5.QtCore import Qt
 import features
 import featurecreator
 import constraints
 import solver
+import render
+import snap
+import export
+import selection
+import session
+import diagnostics
+from workspace import Workspace
 import numpy as np
 
 class Scene:
@@ -13,14 +23,26 @@ class Scene:
         super().__init__()
         self.constraints = []
         self.features = []
-
-    def draw(self, canvas, event, qp, **kwargs):
-        for f in reversed(self.features):
-            f.draw(canvas, event, qp, **kwargs)
+        self.solver_system = None
+        self.solver_constraints = None
+        self.selection = selection.Selection(self, "features")
+        self.constraint_selection = selection.Selection(self, "constraints")
+
+    def system(self):
+        # The solver's analysis of the constraints, with its per-component
+        # factorization state, reused until the set of constraints changes
+        constraints = tuple(self.constraints)
+        if self.solver_system is None or constraints != self.solver_constraints:
+            self.solver_system = solver.System(constraints)
+            self.solver_constraints = constraints
+        return self.solver_system
 
     def add_constraint(self, constraint):
         constraint.system = self
         self.constraints.append(constraint)
+        for f in constraint.features:
+            if constraint not in f.constraints:
+                f.constraints.append(constraint)
 
     def add_feature(self, feature):
         feature.scene = self
@@ -29,10 +51,20 @@ class Scene:
 class Canvas(QtWidgets.QWidget):
     STANDARD_DPI = 96
     SCROLL_FACTOR = 1.001
+    # Solver weight of dragged variables relative to everything else
+    DRAG_WEIGHT = 1e6
+    # Drag steps longer than this, in screen pixels, are solved with continuation
+    # so linkages don't flip between configurations; shorter ones use plain Newton
+    CONTINUATION_PIXELS = 20
 
-    def __init__(self, scene, update_fn):
+    # Emitted from a solver worker thread with the finished future,
+    # and delivered on the GUI thread
+    solved = QtCore.pyqtSignal(object)
+
+    def __init__(self, scene, update_fn, workspace=None):
         self.scene = scene
         self.update_fn = update_fn
+        self.workspace = workspace
         super().__init__()
         self.initUI()
         self.dpi_scale = QtWidgets.QApplication.screens()[0].logicalDotsPerInch() / self.STANDARD_DPI
@@ -40,6 +72,24 @@ class Canvas(QtWidgets.QWidget):
         self.translate = np.array([0., 0.])
         self.drag_view = None
         self.drag_features = None
+        # Whether the current drag has moved anything
+        self.drag_moved = False
+        # While dragging: where the cursor moved to since the last solve
+        # (None if it has not), and where it was at the last solve
+        self.drag_pos = None
+        self.drag_solved_pos = None
+        # The solve running in the workspace pool, if any
+        self.solving = None
+        self.solved.connect(self.solve_finished)
+        self.render_cache = None
+        self.dirty = True
+        # One of diagnostics.MODES to color features by, or None
+        self.diagnostics = None
+        self.overlay = None
+        # A session.Recorder logging input events, or None
+        self.recorder = None
+        self.snapper = snap.Snapper(scene)
+        scene.selection.connect(self.selection_changed)
 
         self.mode = "select"
 
@@ -66,136 +116,286 @@ class Canvas(QtWidgets.QWidget):
     def ixfy(self, y):
         return y / self.scale - self.translate[1]
 
+    def visible_bounds(self, event, margin=10):
+        # Scene-space (xmin, ymin, xmax, ymax) of the repainted area,
+        # padded by a margin in screen pixels so handles aren't clipped
+        r = event.rect()
+        return (self.ixfx(r.left() / self.dpi_scale - margin),
+                self.ixfy(r.top() / self.dpi_scale - margin),
+                self.ixfx(r.right() / self.dpi_scale + margin),
+                self.ixfy(r.bottom() / self.dpi_scale + margin))
+
     def recalculate(self):
+        # While dragging, keep the dragged geometry under the cursor and
+        # move everything else as little as possible. Large drag steps are
+        # followed continuously; small ones are already close to the solution.
+        # With a workspace, the solve runs in its pool and solve_finished()
+        # is called when it is done; otherwise it runs here.
+        weights = None
+        continuation = False
+        if self.drag_pos is not None:
+            # The drag is applied only now, when no solve is running that could
+            # overwrite it with the solution of an earlier frame
+            for f in self.scene.selection:
+                f.drag(self, self.drag_pos)
+            weights = {v: self.DRAG_WEIGHT for f in self.scene.selection for v in f.drag_variables}
+            continuation = np.linalg.norm(self.drag_pos - self.drag_solved_pos) * self.scale > self.CONTINUATION_PIXELS
+            (self.drag_pos, self.drag_solved_pos) = (None, self.drag_pos)
+
+        if self.workspace is not None:
+            self.solving = self.workspace.submit(self.scene, weights, continuation)
+            self.solving.add_done_callback(self.solved.emit)
+            return
+        try:
+            self.scene.system().solve(weights, continuation)
+            self.line_color = Qt.blue
+        except solver.SolverException:
+            self.line_color = Qt.red
+        self.invalidate_solution()
+
+    def solve_finished(self, future):
+        if future is not self.solving:
+            # Already handled by finish()
+            return
+        self.solving = None
         try:
-            solver.solve(self.scene.constraints)
+            future.result()
             self.line_color = Qt.blue
         except solver.SolverException:
             self.line_color = Qt.red
+        self.invalidate_solution()
+        # Repaint, and solve again if the scene changed in the meantime
+        super().update()
+
+    def invalidate_solution(self):
+        self.render_cache = None
+        self.overlay = None
+        self.snapper.invalidate()
+
+    def finish(self):
+        # Wait for solving to finish and bring everything up to date,
+        # for callers that have no event loop (e.g. session replay)
+        self.refresh()
+        while self.solving is not None:
+            concurrent.futures.wait([self.solving])
+            self.solve_finished(self.solving)
+            self.refresh()
+
+    def snap(self, pos, exclude=(), extra=()):
+        # Where a point placed at pos (scene coordinates) should snap to
+        return self.snapper.snap(pos, snap.SNAP_PIXELS / self.scale, exclude, extra)
 
     def hit(self, pos):
         for f in self.scene.features:
             if f.hit(self, pos):
                 return f
 
+    def update(self):
+        # The scene may have changed, so re-solve on the next paint
+        self.dirty = True
+        self.snapper.invalidate()
+        super().update()
+
+    def update_view(self):
+        # Only the view transform changed, so the render cache is still valid
+        super().update()
+
+    def selection_changed(self, added, removed):
+        # Nothing moved, so there is no need to re-solve or rebuild the cache
+        if self.render_cache is not None:
+            self.render_cache.set_selected(removed, False)
+            self.render_cache.set_selected(added, True)
+        self.update_view()
+
+    def set_diagnostics(self, mode):
+        self.diagnostics = mode
+        self.overlay = None
+        self.update_view()
+
+    def evict(self):
+        # Drop cached state; it is rebuilt from the scene on the next paint
+        self.render_cache = None
+        self.overlay = None
+        self.scene.solver_system = None
+
+    def refresh(self):
+        # Bring the solution and caches up to date with the scene, as the next
+        # paint would, re-solving if the scene changed. While a solve is still
+        # running, the last solution is shown and the new one waits for it.
+        if self.dirty and self.solving is None:
+            self.dirty = False
+            self.recalculate()
+        if self.render_cache is None:
+            self.render_cache = render.RenderCache(self.scene)
+            if self.workspace is not None:
+                self.workspace.enforce_budget()
+        if self.diagnostics is not None and self.overlay is None:
+            self.overlay = diagnostics.Overlay(self.scene.system(), self.diagnostics)
+
     def paintEvent(self, event):
-        self.recalculate()
+        self.refresh()
         qp = QtGui.QPainter()
         qp.begin(self)
         qp.scale(self.dpi_scale, self.dpi_scale)
-        self.scene.draw(self, event, qp)
+        self.render_cache.draw(self, event, qp)
+        if self.overlay is not None:
+            self.overlay.draw(self, event, qp)
         if self.mode == "create":
             self.create.draw(self, event, qp)
         qp.end()
 
-    def wheelEvent(self, event):
-        factor = self.SCROLL_FACTOR ** event.angleDelta().y()
-        self.scale *= factor
-        self.update_fn()
+    def record(self, kind, *args):
+        if self.recorder is not None:
+            self.recorder.record(self, kind, *args)
 
-    def keyPressEvent(self, event):
+    def scene_pos(self, event):
+        pos = np.array([event.x(), event.y()]) / self.dpi_scale
+        return np.array([self.ixfx(pos[0]), self.ixfy(pos[1])])
+
+    # Input handling. The Qt event handlers below translate events into
+    # calls to press(), release(), move(), key(), choose() and start_create(),
+    # which take scene coordinates, so that a session.Recorder can log them
+    # and session.replay() can feed them back without a window.
+
+    def press(self, scene_pos, modifiers):
+        # A left button press
+        self.record("press", scene_pos[0], scene_pos[1], int(modifiers))
+        if self.mode == "select":
+            self.drag_features = scene_pos
+            self.drag_moved = False
+            (self.drag_pos, self.drag_solved_pos) = (None, scene_pos)
+
+            f = self.hit(np.array([self.xfx(scene_pos[0]), self.xfy(scene_pos[1])]))
+            if modifiers == Qt.ShiftModifier:
+                if f is not None:
+                    self.scene.selection.add(f)
+            elif modifiers == Qt.ControlModifier:
+                if f is not None:
+                    self.scene.selection.toggle(f)
+            elif f is None or f not in self.scene.selection:
+                self.scene.selection.replace([f] if f is not None else [])
+            for f in self.scene.selection:
+                f.start_drag(self, scene_pos)
+        elif self.mode == "create":
+            self.create.mousePressEvent(self, scene_pos)
+
+    def release(self, scene_pos):
+        # A left button release
+        self.record("release", scene_pos[0], scene_pos[1])
+        if self.mode == "select":
+            self.drag_features = None
+            if self.drag_moved:
+                # The feature and constraint lists show values, so they are
+                # brought up to date once the drag is over
+                self.drag_moved = False
+                self.update_fn()
+        elif self.mode == "create":
+            self.create.mouseReleaseEvent(self, scene_pos)
+
+    def move(self, scene_pos):
+        # Mouse movement; only recorded when it affects the scene
         if self.mode == "create":
-            self.create.keyPressEvent(self, event.key())
+            self.record("move", scene_pos[0], scene_pos[1])
+            self.create.mouseMoveEvent(self, scene_pos)
+        elif self.drag_features is not None:
+            self.record("move", scene_pos[0], scene_pos[1])
+            self.drag_pos = scene_pos
+            self.drag_moved = True
+            # Only the canvas follows the drag; rebuilding the lists would
+            # cost time in proportion to the whole scene on every move
+            self.update()
+
+    def key(self, key):
+        self.record("key", int(key))
+        if self.mode == "create":
+            self.create.keyPressEvent(self, key)
 
         elif self.mode == "select":
-            if event.key() == Qt.Key_Delete:
-                for f in self.scene.features[:]:
-                    if f.selected:
-                        f.delete()
+            if key == Qt.Key_Delete:
+                for f in self.scene.selection:
+                    f.delete()
                 self.update_fn()
 
-    def mousePressEvent(self, event):
-        pos = np.array([event.x(), event.y()]) / self.dpi_scale
-        scene_pos = np.array([self.ixfx(pos[0]), self.ixfy(pos[1])])
+    def start_create(self, creator_class):
+        # Start creating features with one of featurecreator.available
+        self.record("create", creator_class.__name__)
+        creator_class(self)
+
+    def menu_items(self):
+        # What the context menu offers for the current selection:
+        # (name, function of the clicked scene position) pairs
+        selected = list(self.scene.selection)
+        if len(selected) == 0:
+            return []
+
+        def run_action(action_functions):
+            def run(scene_pos):
+                for af in action_functions:
+                    af(self, scene_pos)
+            return run
+
+        def add_constraint(constraint_class):
+            def run(scene_pos):
+                self.scene.add_constraint(constraint_class(*selected))
+            return run
+
+        # Actions
+        items = [(action_name, run_action([action_function] + [dict(feature.actions)[action_name] for feature in selected[1:]]))
+                 for (action_name, action_function) in selected[0].actions
+                 if all([action_name in dict(feature.actions) for feature in selected[1:]])]
+
+        # Constraints
+        items += [(constraint_class.__name__, add_constraint(constraint_class))
+                  for constraint_class in constraints.available if constraint_class.compatible(selected)]
+        return items
+
+    def choose(self, scene_pos, name):
+        # Pick an item from the context menu opened at scene_pos
+        self.record("menu", scene_pos[0], scene_pos[1], name)
+        dict(self.menu_items())[name](scene_pos)
+        self.update_fn()
 
-        if event.button() == Qt.LeftButton:
-            if self.mode == "select":
-                self.drag_features = scene_pos
-
-                if QtWidgets.QApplication.keyboardModifiers() == Qt.ShiftModifier:
-                    f = self.hit(pos)
-                    if f is not None:
-                        f.selected = True
-                elif QtWidgets.QApplication.keyboardModifiers() == Qt.ControlModifier:
-                    f = self.hit(pos)
-                    if f is not None:
-                        f.selected = not f.selected
-                else: 
-                    f = self.hit(pos)
-                    if f is None or not f.selected:
-                        for f2 in self.scene.features:
-                            f2.selected = (f2 == f)
-                for f in self.scene.features:
-                    if f.selected:
-                        f.start_drag(self, scene_pos)
-                self.update_fn()
-            elif self.mode == "create":
-                self.create.mousePressEvent(self, scene_pos)
+    def wheelEvent(self, event):
+        factor = self.SCROLL_FACTOR ** event.angleDelta().y()
+        self.scale *= factor
+        self.update_view()
 
+    def keyPressEvent(self, event):
+        self.key(event.key())
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self.press(self.scene_pos(event), event.modifiers())
         elif event.button() == Qt.MiddleButton:
-            self.drag_view = pos
+            self.drag_view = np.array([event.x(), event.y()]) / self.dpi_scale
 
     def mouseReleaseEvent(self, event):
         if event.button() == Qt.LeftButton:
-            pos = np.array([event.x(), event.y()]) / self.dpi_scale
-            scene_pos = np.array([self.ixfx(pos[0]), self.ixfy(pos[1])])
-            if self.mode == "select":
-                self.drag_features = None
-            elif self.mode == "create":
-                self.create.mouseReleaseEvent(self, scene_pos)
+            self.release(self.scene_pos(event))
         elif event.button() == Qt.MiddleButton:
             self.drag_view = None
 
     def mouseMoveEvent(self, event):
-        pos = np.array([event.x(), event.y()]) / self.dpi_scale
-        scene_pos = np.array([self.ixfx(pos[0]), self.ixfy(pos[1])])
-
-        if self.mode == "create":
-            self.create.mouseMoveEvent(self, scene_pos)
-
-        elif self.drag_features is not None:
-            for f in self.scene.features:
-                if f.selected:
-                    f.drag(self, scene_pos)
-            self.update_fn()
+        if self.mode == "create" or self.drag_features is not None:
+            self.move(self.scene_pos(event))
 
         elif self.drag_view is not None:
+            pos = np.array([event.x(), event.y()]) / self.dpi_scale
             d = (pos - self.drag_view)
             self.translate += d / self.scale
             self.drag_view = pos
-            self.update_fn()
+            self.update_view()
 
     def contextMenuEvent(self, event):
-        selected = [f for f in self.scene.features if f.selected]
-        if len(selected) >= 1:
+        items = self.menu_items()
+        if len(items) >= 1:
             menu = QtWidgets.QMenu(self)
-
-            pos = np.array([event.x(), event.y()]) / self.dpi_scale
-            scene_pos = np.array([self.ixfx(pos[0]), self.ixfy(pos[1])])
-
-            # Actions
-            available_actions = [(action_name, [action_function] + [dict(feature.actions)[action_name] for feature in selected[1:]])
-                                 for (action_name, action_function) in selected[0].actions
-                                 if all([action_name in dict(feature.actions) for feature in selected[1:]])]
-            action_menu_items = [(menu.addAction(action_name), action_functions) for (action_name, action_functions) in available_actions]
-
-            # Constraints
-            available_constraints = [constraint_class for constraint_class in constraints.available if constraint_class.compatible(selected)]
-            constraint_menu_items = [(menu.addAction(constraint_class.__name__), constraint_class) for constraint_class in available_constraints]
-
+            menu_actions = [(menu.addAction(name), name) for (name, run) in items]
             result = menu.exec_(self.mapToGlobal(event.pos()))
-            for (menu_action, action_functions) in action_menu_items:
+            for (menu_action, name) in menu_actions:
                 if result == menu_action:
-                    for af in action_functions:
-                        af(self, scene_pos)
+                    self.choose(self.scene_pos(event), name)
                     break
-            else:
-                for (menu_constraint, constraint_class) in constraint_menu_items:
-                    if result == menu_constraint:
-                        self.scene.add_constraint(constraint_class(*selected))
-                        break
-
-            self.update_fn()
 
 class FeatureList(QtWidgets.QListWidget):
     def __init__(self, scene, update_fn):
@@ -205,42 +405,47 @@ class FeatureList(QtWidgets.QListWidget):
         self.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
         self.itemSelectionChanged.connect(self.onItemSelectionChanged)
         self.updating = False
+        self.items = {}
+        scene.selection.connect(self.selection_changed)
 
     def onItemSelectionChanged(self):
         if self.updating:
             return
+        self.scene.selection.replace(item.feature for item in self.selectedItems())
 
-        for i in range(self.count()):
-            item = self.item(i)
-            item.feature.selected = item.isSelected()
-
-        self.update_fn()
+    def selection_changed(self, added, removed):
+        # Mirror the scene's selection, touching only the items that changed
+        self.updating = True
+        for (fs, selected) in ((removed, False), (added, True)):
+            for f in fs:
+                if f in self.items:
+                    self.items[f].setSelected(selected)
+        self.updating = False
 
     def update(self):
         self.updating = True
-        to_select = []
 
         def widget(f):
             item = QtWidgets.QListWidgetItem(str(f))
             item.feature = f
-            if f.selected:
-                to_select.append(item)
+            self.items[f] = item
             return item
 
         self.clear()
+        self.items = {}
         for f in self.scene.features:
             self.addItem(widget(f))
 
-        for item in to_select:
-            item.setSelected(True)
+        for f in self.scene.selection:
+            if f in self.items:
+                self.items[f].setSelected(True)
         super().update()
         self.updating = False
 
     def keyPressEvent(self, event):
         if event.key() == Qt.Key_Delete:
-            for f in self.scene.features[:]:
-                if f.selected:
-                    f.delete()
+            for f in self.scene.selection:
+                f.delete()
             self.update_fn()
 
 class ConstraintList(QtWidgets.QListWidget):
@@ -251,97 +456,226 @@ class ConstraintList(QtWidgets.QListWidget):
         self.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
         self.itemSelectionChanged.connect(self.onItemSelectionChanged)
         self.updating = False
+        self.items = {}
+        scene.constraint_selection.connect(self.selection_changed)
 
     def onItemSelectionChanged(self):
         if self.updating:
             return
+        # Selecting constraints selects the features they constrain
+        self.scene.constraint_selection.replace(item.constraint for item in self.selectedItems())
+        self.scene.selection.replace(f for c in self.scene.constraint_selection for f in c.features)
 
-        for f in self.scene.features:
-            f.selected = False
-
-        for i in range(self.count()):
-            item = self.item(i)
-            item.constraint.q_selected = item.isSelected()
-            if item.isSelected():
-                for f in item.constraint.features:
-                    f.selected = True
-
-        self.update_fn()
+    def selection_changed(self, added, removed):
+        self.updating = True
+        for (cs, selected) in ((removed, False), (added, True)):
+            for c in cs:
+                if c in self.items:
+                    self.items[c].setSelected(selected)
+        self.updating = False
 
     def update(self):
         self.updating = True
 
-        to_select = []
-
         def widget(c):
             item = QtWidgets.QListWidgetItem(str(c))
             item.constraint = c
-            if not hasattr(c, "q_selected"):
-                c.q_selected = False
-            if c.q_selected:
-                to_select.append(item)
+            self.items[c] = item
             return item
 
         self.clear()
+        self.items = {}
         for c in self.scene.constraints:
             self.addItem(widget(c))
 
-        for item in to_select:
-            item.setSelected(True)
+        for c in self.scene.constraint_selection:
+            if c in self.items:
+                self.items[c].setSelected(True)
         super().update()
         self.updating = False
 
     def keyPressEvent(self, event):
         if event.key() == Qt.Key_Delete:
-           for i in range(self.count()):
-                item = self.item(i)
-                if item.isSelected():
-                    item.constraint.delete()
-           self.update_fn()
+            for c in self.scene.constraint_selection:
+                c.delete()
+            self.update_fn()
+
+class Document(QtWidgets.QSplitter):
+    # One open sketch: a scene and the widgets that view it
+    def __init__(self, workspace):
+        super().__init__()
+        self.workspace = workspace
+        self.scene = Scene()
+        self.canvas = Canvas(self.scene, self.update_fn, workspace=workspace)
+        self.feature_list = FeatureList(self.scene, self.update_fn)
+        self.constraint_list = ConstraintList(self.scene, self.update_fn)
+
+        self.addWidget(self.feature_list)
+        self.addWidget(self.canvas)
+        self.addWidget(self.constraint_list)
+
+        workspace.add(self.canvas)
+
+    def update_fn(self):
+        self.canvas.update()
+        self.feature_list.update()
+        self.constraint_list.update()
+
+    def release(self):
+        self.workspace.remove(self.canvas)
+        if self.canvas.recorder is not None:
+            self.canvas.recorder.close()
+            self.canvas.recorder = None
+
+def add_menus(mb, tabs, new_document, close_document):
+    file_menu = mb.addMenu("&File")
+    new_action = QtWidgets.QAction("&New", file_menu)
+    new_action.setShortcut(QtGui.QKeySequence.New)
+    new_action.triggered.connect(new_document)
+    file_menu.addAction(new_action)
+    record_action = QtWidgets.QAction("New &recorded sketch...", file_menu)
+    def new_recorded_document():
+        # Sessions are replayed from an empty sketch, so only new ones are recorded
+        (filename, _) = QtWidgets.QFileDialog.getSaveFileName(mb, "Record session", "", "Pancake session (*.session)")
+        if filename:
+            try:
+                # Line buffered, so the log survives a hang or crash
+                out = open(filename, "w", buffering=1)
+            except OSError as e:
+                QtWidgets.QMessageBox.critical(mb, "Record session", str(e))
+                return
+            new_document().canvas.recorder = session.Recorder(out)
+    record_action.triggered.connect(new_recorded_document)
+    file_menu.addAction(record_action)
+    export_action = QtWidgets.QAction("&Export...", file_menu)
+    def export_document():
+        document = tabs.currentWidget()
+        if document is None:
+            return
+        filters = {"SVG (*.svg)": ".svg", "DXF (*.dxf)": ".dxf"}
+        (filename, selected_filter) = QtWidgets.QFileDialog.getSaveFileName(mb, "Export", "", ";;".join(filters))
+        if not filename:
+            return
+        # A name typed without an extension gets the selected filter's
+        if os.path.splitext(filename)[1] == "":
+            filename += filters.get(selected_filter, ".svg")
+        try:
+            export.export(document.scene.features, filename)
+        except (ValueError, OSError) as e:
+            QtWidgets.QMessageBox.critical(mb, "Export", str(e))
+    export_action.triggered.connect(export_document)
+    file_menu.addAction(export_action)
+    graph_action = QtWidgets.QAction("Export constraint &graph...", file_menu)
+    def export_graph():
+        document = tabs.currentWidget()
+        if document is None:
+            return
+        (filename, _) = QtWidgets.QFileDialog.getSaveFileName(mb, "Export constraint graph", "", "Graphviz (*.dot)")
+        if filename:
+            try:
+                with open(filename, "w") as out:
+                    diagnostics.write_graph(document.scene.system(), out)
+            except OSError as e:
+                QtWidgets.QMessageBox.critical(mb, "Export constraint graph", str(e))
+    graph_action.triggered.connect(export_graph)
+    file_menu.addAction(graph_action)
+    close_action = QtWidgets.QAction("&Close", file_menu)
+    close_action.setShortcut(QtGui.QKeySequence.Close)
+    close_action.triggered.connect(lambda: close_document(tabs.currentIndex()))
+    file_menu.addAction(close_action)
 
-def add_menus(mb):
     create_menu = mb.addMenu("&Create")
     for fc in featurecreator.available:
         action = QtWidgets.QAction(fc.__name__, create_menu)
         def wrap(fc_):
-            return lambda:fc_(canvas)
+            def create():
+                if tabs.currentWidget() is not None:
+                    tabs.currentWidget().canvas.start_create(fc_)
+            return create
         action.triggered.connect(wrap(fc))
         create_menu.addAction(action)
 
-def main():
-    global scene
-    global canvas
+    edit_menu = mb.addMenu("&Edit")
+    def selection_action(name, shortcut, operation):
+        action = QtWidgets.QAction(name, edit_menu)
+        if shortcut is not None:
+            action.setShortcut(shortcut)
+        def run():
+            if tabs.currentWidget() is not None:
+                operation(tabs.currentWidget().scene.selection)
+        action.triggered.connect(run)
+        return action
+    edit_menu.addAction(selection_action("Select &all", QtGui.QKeySequence.SelectAll, lambda s: s.select_all()))
+    edit_menu.addAction(selection_action("&Invert selection", None, lambda s: s.invert()))
+    edit_menu.addAction(selection_action("Select &connected", None, lambda s: s.select_connected()))
+    select_type_menu = edit_menu.addMenu("Select by &type")
+    for feature_class in (features.Point, features.Line, features.Circle, features.Arc):
+        def wrap(feature_class_):
+            return lambda s: s.select_type(feature_class_)
+        select_type_menu.addAction(selection_action(feature_class.__name__, None, wrap(feature_class)))
+
+    # Solver diagnostics, from the last solve of the current document
+    view_menu = mb.addMenu("&View")
+    diagnostics_menu = view_menu.addMenu("&Diagnostics")
+    diagnostics_group = QtWidgets.QActionGroup(diagnostics_menu)
+    for (mode, label) in ((None, "Off"),) + diagnostics.MODES:
+        action = QtWidgets.QAction(label, diagnostics_menu)
+        action.setCheckable(True)
+        action.setChecked(mode is None)
+        def wrap(mode_):
+            def show():
+                if tabs.currentWidget() is not None:
+                    tabs.currentWidget().canvas.set_diagnostics(mode_)
+            return show
+        action.triggered.connect(wrap(mode))
+        diagnostics_group.addAction(action)
+        diagnostics_menu.addAction(action)
 
+def main():
     app = QtWidgets.QApplication(sys.argv)
 
     w = QtWidgets.QMainWindow()
     w.setWindowTitle("Pancake")
 
-    def update_fn():
-        canvas.update()
-        feature_list.update()
-        constraint_list.update()
+    workspace = Workspace()
+    tabs = QtWidgets.QTabWidget()
+    tabs.setTabsClosable(True)
+    tabs.setDocumentMode(True)
+    count = [0]
 
-    scene = Scene()
-    canvas = Canvas(scene, update_fn)
-    feature_list = FeatureList(scene, update_fn)
-    constraint_list = ConstraintList(scene, update_fn)
+    def new_document():
+        count[0] += 1
+        document = Document(workspace)
+        tabs.setCurrentIndex(tabs.addTab(document, "Sketch {}".format(count[0])))
+        document.update_fn()
+        return document
 
-    splitter = QtWidgets.QSplitter()
+    def close_document(index):
+        document = tabs.widget(index)
+        if document is not None:
+            tabs.removeTab(index)
+            document.release()
+            document.deleteLater()
 
-    splitter.addWidget(feature_list)
-    splitter.addWidget(canvas)
-    splitter.addWidget(constraint_list)
+    def activate(index):
+        document = tabs.widget(index)
+        if document is not None:
+            workspace.activate(document.canvas)
 
-    w.setCentralWidget(splitter)
+    tabs.currentChanged.connect(activate)
+    tabs.tabCloseRequested.connect(close_document)
 
-    add_menus(w.menuBar())
+    w.setCentralWidget(tabs)
 
-    w.show()
+    add_menus(w.menuBar(), tabs, new_document, close_document)
 
-    update_fn()
+    new_document()
+
+    w.show()
 
-    sys.exit(app.exec_())
+    status = app.exec_()
+    workspace.shutdown()
+    sys.exit(status)
 
 if __name__ == "__main__":
     main()
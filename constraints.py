@@ -2,6 +2,11 @@ import numpy as np
 import features
 
 class Constraint:
+    # Pairs of variables that are equal, and (variable, value) pairs that are fixed.
+    # The solver eliminates these before iterating.
+    aliases = ()
+    fixes = ()
+
     def __init__(self, system=None):
         self.system = system
         self.variables = tuple()
@@ -31,10 +36,12 @@ class Constraint:
 
     def delete(self):
         for f in self.features[:]:
-            if f in self.features:
+            if self in f.constraints:
                 f.constraints.remove(self)
-        if system is not None:
-            system.constraints.remove(self)
+        if self.system is not None and self in self.system.constraints:
+            self.system.constraints.remove(self)
+            if hasattr(self.system, "constraint_selection"):
+                self.system.constraint_selection.discard(self)
 
         # Do not use the constraint after this point
         self.features = []
@@ -42,6 +49,15 @@ class Constraint:
     def __str__(self):
         return "{}".format(self.__class__.__name__)
 
+def value(v):
+    # Constraint values may be plain numbers or driving Parameters
+    if isinstance(v, features.Parameter):
+        return v.var.value
+    return v
+
+def parameters(*vs):
+    return tuple(v for v in vs if isinstance(v, features.Parameter))
+
 def line_or_two_points(fs):
     return (len(fs) == 1 and
             isinstance(fs[0], features.Line) or
@@ -49,6 +65,32 @@ def line_or_two_points(fs):
             isinstance(fs[0], features.Point) and
             isinstance(fs[1], features.Point))
 
+def two_points(fs):
+    return (len(fs) == 2 and
+            isinstance(fs[0], features.Point) and
+            isinstance(fs[1], features.Point))
+
+def two_circles(fs):
+    return (len(fs) == 2 and
+            isinstance(fs[0], features.Circle) and
+            isinstance(fs[1], features.Circle))
+
+def in_order(fs, *classes):
+    # Returns the given features sorted to match the given classes, or None
+    if len(fs) != len(classes):
+        return None
+    for ordering in (fs, tuple(reversed(fs))):
+        if all(isinstance(f, c) for (f, c) in zip(ordering, classes)):
+            return tuple(ordering)
+    return None
+
+def shared_endpoint(l, a):
+    # The endpoint Point a line shares with an arc, or None
+    for p in (l.p1, l.p2):
+        if p is a.p1 or p is a.p2:
+            return p
+    return None
+
 def two_lines(fs):
     return (len(fs) == 2 and
             isinstance(fs[0], features.Line) and
@@ -60,7 +102,7 @@ class FixedDistance(Constraint):
         self.dist = dist
         self.p1 = p1
         self.p2 = p2
-        self.features = (self.p1, self.p2)
+        self.features = (self.p1, self.p2) + parameters(dist)
         self.variables = (self.p1.x, self.p1.y, self.p2.x, self.p2.y)
 
     def f(self, variables):
@@ -68,7 +110,7 @@ class FixedDistance(Constraint):
         p1y = variables[self.p1.y]
         p2x = variables[self.p2.x]
         p2y = variables[self.p2.y]
-        return lambda x: np.array([(x[p2x] - x[p1x]) ** 2 + (x[p2y] - x[p1y]) ** 2 - self.dist ** 2])
+        return lambda x: np.array([(x[p2x] - x[p1x]) ** 2 + (x[p2y] - x[p1y]) ** 2 - value(self.dist) ** 2])
 
     def df(self, variables):
         p1x = variables[self.p1.x]
@@ -123,9 +165,13 @@ class Fixed:
         self.val = val
         self.variables = (self.var,)
 
+    @property
+    def fixes(self):
+        return ((self.var, value(self.val)),)
+
     def f(self, variables):
         v = variables[self.var]
-        return lambda x: np.array([x[v] - self.val])
+        return lambda x: np.array([x[v] - value(self.val)])
 
     def df(self, variables):
         v = variables[self.var]
@@ -142,6 +188,10 @@ class Equal:
         self.var2 = var2
         self.variables = (var1, var2)
 
+    @property
+    def aliases(self):
+        return ((self.var1, self.var2),)
+
     def f(self, variables):
         v1 = variables[self.var1]
         v2 = variables[self.var2]
@@ -160,12 +210,12 @@ class Equal:
 class FixedX(Fixed, Constraint):
     def __init__(self, point, val, **kwargs):
         super().__init__(point.x, val, **kwargs)
-        self.features = (point,)
+        self.features = (point,) + parameters(val)
 
 class FixedY(Fixed, Constraint):
     def __init__(self, point, val, **kwargs):
         super().__init__(point.y, val, **kwargs)
-        self.features = (point,)
+        self.features = (point,) + parameters(val)
 
 class Vertical(Equal, Constraint):
     def __init__(self, *args, **kwargs):
@@ -199,6 +249,88 @@ class Horizontal(Equal, Constraint):
     def compatible(cls, fs):
         return line_or_two_points(fs)
 
+class Coincident(Constraint):
+    # Handled by the solver as variable aliasing rather than as equations,
+    # so joining points removes unknowns instead of adding rows
+    def __init__(self, *args, **kwargs):
+        self.assert_compatible(args)
+        (p1, p2) = args
+        super().__init__(**kwargs)
+        self.p1 = p1
+        self.p2 = p2
+        self.features = (p1, p2)
+        self.variables = (p1.x, p1.y, p2.x, p2.y)
+
+    @property
+    def aliases(self):
+        return ((self.p1.x, self.p2.x), (self.p1.y, self.p2.y))
+
+    @classmethod
+    def compatible(cls, fs):
+        return two_points(fs)
+
+class PointOnLine(Constraint):
+    # The point is collinear with the line: (p2 - p1) x (p - p1) = 0
+    def __init__(self, *args, **kwargs):
+        self.assert_compatible(args)
+        (p, l) = in_order(args, features.Point, features.Line)
+        super().__init__(**kwargs)
+        self.p = p
+        self.l = l
+        self.features = (p, l)
+        self.variables = (p.x, p.y, l.p1.x, l.p1.y, l.p2.x, l.p2.y)
+
+    @classmethod
+    def compatible(cls, fs):
+        return in_order(fs, features.Point, features.Line) is not None
+
+    def f(self, variables):
+        i = np.array([variables[v] for v in self.variables])
+        def _f(x):
+            (px, py, p1x, p1y, p2x, p2y) = x[i]
+            return np.array([(p2x - p1x) * (py - p1y) - (p2y - p1y) * (px - p1x)])
+        return _f
+
+    def df(self, variables):
+        i = np.array([variables[v] for v in self.variables])
+        def _df(x):
+            (px, py, p1x, p1y, p2x, p2y) = x[i]
+            p = np.zeros((1, len(variables)))
+            np.add.at(p[0], i, (-(p2y - p1y), p2x - p1x, p2y - py, px - p2x, py - p1y, -(px - p1x)))
+            return p
+        return _df
+
+class Midpoint(Constraint):
+    # The point is halfway between the line's endpoints
+    def __init__(self, *args, **kwargs):
+        self.assert_compatible(args)
+        (p, l) = in_order(args, features.Point, features.Line)
+        super().__init__(**kwargs)
+        self.p = p
+        self.l = l
+        self.features = (p, l)
+        self.variables = (p.x, p.y, l.p1.x, l.p1.y, l.p2.x, l.p2.y)
+
+    @classmethod
+    def compatible(cls, fs):
+        return in_order(fs, features.Point, features.Line) is not None
+
+    def f(self, variables):
+        i = np.array([variables[v] for v in self.variables])
+        def _f(x):
+            (px, py, p1x, p1y, p2x, p2y) = x[i]
+            return np.array([2 * px - p1x - p2x, 2 * py - p1y - p2y])
+        return _f
+
+    def df(self, variables):
+        i = np.array([variables[v] for v in self.variables])
+        def _df(x):
+            p = np.zeros((2, len(variables)))
+            np.add.at(p[0], i[[0, 2, 4]], (2, -1, -1))
+            np.add.at(p[1], i[[1, 3, 5]], (2, -1, -1))
+            return p
+        return _df
+
 class CongruentLines(Constraint):
     def __init__(self, *args, **kwargs):
         self.assert_compatible(args)
@@ -285,13 +417,13 @@ class Parallel(Constraint):
         def _df(x):
             p = np.zeros((1, len(variables)))
             p[0, l1p1x] = -(x[l2p2y] - x[l2p1y])
-            p[0, l1p1y] = -(x[l2p2x] - x[l2p1x])
+            p[0, l1p1y] =  (x[l2p2x] - x[l2p1x])
             p[0, l1p2x] =  (x[l2p2y] - x[l2p1y])
-            p[0, l1p2y] =  (x[l2p2x] - x[l2p1x])
+            p[0, l1p2y] = -(x[l2p2x] - x[l2p1x])
             p[0, l2p1x] =  (x[l1p2y] - x[l1p1y])
-            p[0, l2p1y] =  (x[l1p2x] - x[l1p1x])
+            p[0, l2p1y] = -(x[l1p2x] - x[l1p1x])
             p[0, l2p2x] = -(x[l1p2y] - x[l1p1y])
-            p[0, l2p2y] = -(x[l1p2x] - x[l1p1x])
+            p[0, l2p2y] =  (x[l1p2x] - x[l1p1x])
             return p
         return _df
 
@@ -343,12 +475,145 @@ class Perpendicular(Constraint):
             return p
         return _df
 
+class PointOnCircle(Constraint):
+    # The point is on the circle: |p - center|^2 = r^2.
+    # For an arc this is the arc's whole circle, which is what holds the
+    # arc's own endpoints on it; an equation cannot keep a point within the span.
+    def __init__(self, *args, **kwargs):
+        self.assert_compatible(args)
+        (p, c) = in_order(args, features.Point, features.Circle)
+        super().__init__(**kwargs)
+        self.p = p
+        self.c = c
+        self.features = (p, c)
+        self.variables = (p.x, p.y, c.center.x, c.center.y, c.radius.var)
+
+    @classmethod
+    def compatible(cls, fs):
+        return in_order(fs, features.Point, features.Circle) is not None
+
+    def f(self, variables):
+        (px, py, cx, cy, r) = (variables[v] for v in self.variables)
+        return lambda x: np.array([(x[px] - x[cx]) ** 2 + (x[py] - x[cy]) ** 2 - x[r] ** 2])
+
+    def df(self, variables):
+        i = np.array([variables[v] for v in self.variables])
+        def _df(x):
+            (px, py, cx, cy, r) = x[i]
+            (dx, dy) = (px - cx, py - cy)
+            p = np.zeros((1, len(variables)))
+            np.add.at(p[0], i, (2 * dx, 2 * dy, -2 * dx, -2 * dy, -2 * r))
+            return p
+        return _df
+
+class Tangent(Constraint):
+    # With a circle, the squared distance from the center to the line equals the squared radius:
+    # (d x w)^2 - r^2 |d|^2 = 0 with d = p2 - p1 and w = center - p1.
+    # With an arc, the line must start at one of the arc's endpoints, and is
+    # perpendicular to the radius there: (p - center) . (q - p) = 0, where p is
+    # the shared endpoint and q the line's other end. Tangency to the rest of
+    # the arc's circle would not generally touch the arc.
+    def __init__(self, *args, **kwargs):
+        self.assert_compatible(args)
+        (l, c) = in_order(args, features.Line, features.Circle)
+        super().__init__(**kwargs)
+        self.l = l
+        self.c = c
+        self.features = (l, c)
+        if isinstance(c, features.Arc):
+            p = shared_endpoint(l, c)
+            q = l.p2 if p is l.p1 else l.p1
+            self.variables = (p.x, p.y, q.x, q.y, c.center.x, c.center.y)
+        else:
+            self.variables = (l.p1.x, l.p1.y, l.p2.x, l.p2.y, c.center.x, c.center.y, c.radius.var)
+
+    @classmethod
+    def compatible(cls, fs):
+        fs = in_order(fs, features.Line, features.Circle)
+        return fs is not None and (not isinstance(fs[1], features.Arc) or shared_endpoint(*fs) is not None)
+
+    def f(self, variables):
+        i = np.array([variables[v] for v in self.variables])
+        if isinstance(self.c, features.Arc):
+            def _f(x):
+                (px, py, qx, qy, cx, cy) = x[i]
+                return np.array([(px - cx) * (qx - px) + (py - cy) * (qy - py)])
+            return _f
+        def _f(x):
+            (p1x, p1y, p2x, p2y, cx, cy, r) = x[i]
+            (dx, dy, wx, wy) = (p2x - p1x, p2y - p1y, cx - p1x, cy - p1y)
+            return np.array([(dx * wy - dy * wx) ** 2 - r ** 2 * (dx ** 2 + dy ** 2)])
+        return _f
+
+    def df(self, variables):
+        i = np.array([variables[v] for v in self.variables])
+        if isinstance(self.c, features.Arc):
+            def _df(x):
+                (px, py, qx, qy, cx, cy) = x[i]
+                p = np.zeros((1, len(variables)))
+                np.add.at(p[0], i, (qx - 2 * px + cx, qy - 2 * py + cy, px - cx, py - cy, px - qx, py - qy))
+                return p
+            return _df
+        def _df(x):
+            (p1x, p1y, p2x, p2y, cx, cy, r) = x[i]
+            (dx, dy, wx, wy) = (p2x - p1x, p2y - p1y, cx - p1x, cy - p1y)
+            cross = dx * wy - dy * wx
+            dcross = np.array([dy - wy, wx - dx, wy, -wx, -dy, dx, 0])
+            dlength = np.array([-2 * dx, -2 * dy, 2 * dx, 2 * dy, 0, 0, 0])
+            row = 2 * cross * dcross - r ** 2 * dlength
+            row[6] = -2 * r * (dx ** 2 + dy ** 2)
+            p = np.zeros((1, len(variables)))
+            np.add.at(p[0], i, row)
+            return p
+        return _df
+
+class Concentric(Constraint):
+    def __init__(self, *args, **kwargs):
+        self.assert_compatible(args)
+        (c1, c2) = args
+        super().__init__(**kwargs)
+        self.c1 = c1
+        self.c2 = c2
+        self.features = (c1, c2)
+        self.variables = (c1.center.x, c1.center.y, c2.center.x, c2.center.y)
 
+    @property
+    def aliases(self):
+        return ((self.c1.center.x, self.c2.center.x), (self.c1.center.y, self.c2.center.y))
+
+    @classmethod
+    def compatible(cls, fs):
+        return two_circles(fs)
+
+class EqualRadius(Constraint):
+    def __init__(self, *args, **kwargs):
+        self.assert_compatible(args)
+        (c1, c2) = args
+        super().__init__(**kwargs)
+        self.c1 = c1
+        self.c2 = c2
+        self.features = (c1, c2)
+        self.variables = (c1.radius.var, c2.radius.var)
+
+    @property
+    def aliases(self):
+        return ((self.c1.radius.var, self.c2.radius.var),)
+
+    @classmethod
+    def compatible(cls, fs):
+        return two_circles(fs)
 
 available = (
+    Coincident,
     Vertical,
     Horizontal,
     CongruentLines,
     Parallel,
-    Perpendicular
+    Perpendicular,
+    PointOnLine,
+    Midpoint,
+    PointOnCircle,
+    Tangent,
+    Concentric,
+    EqualRadius
 )
@@ -0,0 +1,111 @@
+import concurrent.futures
+import io
+import os
+import pickle
+import numpy as np
+import solver
+
+def sweep(eqs, parameters, table, outputs, processes=None):
+    # Solve the same sketch once per row of a design table.
+    #
+    # eqs: the constraints of the sketch
+    # parameters: the features.Parameter driving each column of the table
+    # table: array of shape (rows, len(parameters))
+    # outputs: the Variables to record for each row
+    #
+    # Returns an array of shape (rows, len(outputs)); rows that fail
+    # to solve are NaN. The sketch itself is left unchanged.
+    #
+    # Rows are sorted so that neighbouring parameter vectors end up in the
+    # same chunk, and the chunks are solved in separate processes.
+    table = np.atleast_2d(np.asarray(table, dtype=float))
+    assert table.shape[1] == len(parameters), ValueError("table must have one column per parameter")
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = max(1, min(processes, len(table)))
+
+    order = np.lexsort(table.T[::-1])
+    chunks = np.array_split(order, processes)
+
+    results = np.full((len(table), len(outputs)), np.nan)
+    if processes == 1:
+        results[order] = sweep_rows(eqs, parameters, table[order], outputs)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as pool:
+            sketch = snapshot(eqs, parameters, outputs)
+            futures = [(chunk, pool.submit(sweep_snapshot, sketch, table[chunk])) for chunk in chunks]
+            for (chunk, future) in futures:
+                results[chunk] = future.result()
+    return results
+
+class SketchPickler(pickle.Pickler):
+    # Pickles the given scenes as None
+    def __init__(self, out, scenes):
+        super().__init__(out)
+        self.scenes = scenes
+
+    def persistent_id(self, obj):
+        if id(obj) in self.scenes:
+            return "scene"
+        return None
+
+class SketchUnpickler(pickle.Unpickler):
+    def persistent_load(self, pid):
+        return None
+
+def snapshot(eqs, parameters, outputs):
+    # Pickle what a worker needs to solve the sketch. Constraints and features
+    # refer back to the scene that holds them, and through it to solver caches
+    # and GUI callbacks that cannot be pickled; a worker needs none of those,
+    # so every such reference is pickled as None.
+    scenes = [getattr(e, "system", None) for e in eqs] + [getattr(f, "scene", None) for e in eqs for f in e.features]
+    out = io.BytesIO()
+    SketchPickler(out, {id(s) for s in scenes if s is not None}).dump((eqs, parameters, outputs))
+    return out.getvalue()
+
+def sweep_snapshot(sketch, table):
+    (eqs, parameters, outputs) = SketchUnpickler(io.BytesIO(sketch)).load()
+    return sweep_rows(eqs, parameters, table, outputs)
+
+def sweep_rows(eqs, parameters, table, outputs):
+    # Solve each row in turn, warm-starting from the solution of the
+    # nearest row solved so far. The symbolic analysis is done once.
+    system = solver.System(eqs)
+    variables = solver.remove_duplicates([v for e in eqs for v in e.variables] + list(outputs) + [p.var for p in parameters])
+    variables_dict = {v: i for (i, v) in enumerate(variables)}
+    output_index = [variables_dict[v] for v in outputs]
+
+    initial = np.array([v.value for v in variables])
+    solved_rows = np.empty_like(table)
+    solved_states = np.empty((len(table), len(variables)))
+    n_solved = 0
+    results = np.full((len(table), len(outputs)), np.nan)
+
+    try:
+        for (i, row) in enumerate(table):
+            if n_solved > 0:
+                nearest = np.argmin(np.sum((solved_rows[:n_solved] - row) ** 2, axis=1))
+                state = solved_states[nearest]
+            else:
+                state = initial
+            for (v, value) in zip(variables, state):
+                v.value = value
+            for (p, value) in zip(parameters, row):
+                p.var.value = value
+
+            try:
+                system.solve()
+            except solver.SolverException:
+                continue
+
+            state = np.array([v.value for v in variables])
+            solved_rows[n_solved] = row
+            solved_states[n_solved] = state
+            n_solved += 1
+            results[i] = state[output_index]
+    finally:
+        for (v, value) in zip(variables, initial):
+            v.value = value
+
+    return results
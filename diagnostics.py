@@ -0,0 +1,90 @@
+import numpy as np
+from PyQt5 import QtGui
+import solver
+
+# What the overlay can color features by: (key, label)
+MODES = (
+    ("size", "Component size"),
+    ("iterations", "Newton iterations"),
+    ("residual", "Residual"),
+)
+
+def constraint_stats(system):
+    # Statistics of each constraint from the last solve of a solver.System:
+    # {constraint: (unknowns in its component, iterations of its component, largest residual)}
+    # Constraints handled by the presolve (aliases and fixed values) are left out,
+    # as are components that the last solve did not reach.
+    stats = {}
+    for component in system.components:
+        if component.iterations is None or component.residuals is None:
+            continue
+        for (e, residual) in zip(component.eqs, component.residuals):
+            stats[e] = (len(component.unknowns), component.iterations, residual)
+    return stats
+
+def feature_values(system, mode):
+    # The value to color each feature by, which is the largest over the constraints on it
+    index = [key for (key, label) in MODES].index(mode)
+    values = {}
+    for (e, stat) in constraint_stats(system).items():
+        for f in e.features:
+            values[f] = max(values.get(f, 0.), stat[index])
+    return values
+
+def fractions(values, mode):
+    # Scale values to [0, 1]; residuals on a log scale starting at the solver tolerance
+    v = np.array(list(values.values()), dtype=float)
+    if mode == "residual":
+        v = np.log10(np.maximum(v, solver.EPSILON) / solver.EPSILON)
+    top = np.max(v, initial=0.)
+    if top > 0:
+        v = v / top
+    return dict(zip(values, v))
+
+def heat(fraction):
+    # Blue when cold, through green and yellow, to red when hot
+    return QtGui.QColor.fromHsvF((1. - fraction) * 2. / 3., 1., 0.9)
+
+class Overlay:
+    # Constrained features colored by one of the MODES, from the last solve,
+    # drawn over the sketch. Build it again after every solve.
+
+    def __init__(self, system, mode):
+        self.mode = mode
+        values = feature_values(system, mode)
+        self.maximum = max(values.values(), default=0.)
+        self.colors = {f: heat(x) for (f, x) in fractions(values, mode).items()}
+
+    def draw(self, canvas, event, qp):
+        bounds = canvas.visible_bounds(event)
+        for (f, color) in self.colors.items():
+            if f.visible(bounds):
+                f.draw(canvas, event, qp, color=color)
+        qp.setPen(heat(1.))
+        qp.drawText(10, 20, "{}: max {:.3g}".format(dict(MODES)[self.mode], self.maximum))
+
+def write_graph(system, out):
+    # Write the constraint-variable graph of a solver.System to a text stream
+    # as Graphviz DOT, for offline analysis. Each component is a cluster;
+    # constraints are boxes carrying the last solve's statistics as attributes,
+    # unknowns (after aliasing) are ellipses, and an edge joins each constraint
+    # to each unknown it involves. Fixed variables are constants to the solver,
+    # so they are left out.
+    stats = constraint_stats(system)
+    out.write("graph constraints {\n")
+    for (k, component) in enumerate(system.components):
+        iterations = "" if component.iterations is None else component.iterations
+        out.write('subgraph cluster_{} {{\nlabel="component {}";\nunknowns={};\niterations="{}";\n'.format(
+            k, k, len(component.unknowns), iterations))
+        unknowns = {v: "v{}_{}".format(k, i) for (i, v) in enumerate(component.unknowns)}
+        for (v, name) in unknowns.items():
+            out.write('{} [shape=ellipse, label="{}"];\n'.format(name, str(v)))
+        for (i, e) in enumerate(component.eqs):
+            name = "c{}_{}".format(k, i)
+            residual = stats[e][2] if e in stats else ""
+            out.write('{} [shape=box, label="{}", residual="{}"];\n'.format(name, e.__class__.__name__, residual))
+            for v in solver.remove_duplicates([system.aliases.find(v) for v in e.variables]):
+                if v in unknowns:
+                    out.write("{} -- {};\n".format(name, unknowns[v]))
+        out.write("}\n")
+    out.write("}\n")
@@ -0,0 +1,106 @@
+import os
+import sys
+import runpy
+import numpy as np
+import features
+import solver
+
+# Margin around the drawing in SVG output, in scene units
+SVG_MARGIN = 10.
+
+def geometry(fs):
+    # Stream the solved geometry of the given features as plain tuples:
+    # ("line", x1, y1, x2, y2), ("circle", cx, cy, r)
+    # and ("arc", cx, cy, r, start, end) with angles in radians.
+    # Points and other features have no exported geometry.
+    for f in fs:
+        if isinstance(f, features.Line):
+            yield ("line", f.p1.x.value, f.p1.y.value, f.p2.x.value, f.p2.y.value)
+        elif isinstance(f, features.Arc):
+            yield ("arc", f.center.x.value, f.center.y.value, abs(f.radius.var.value), f.start_angle(), f.start_angle() + f.span())
+        elif isinstance(f, features.Circle):
+            yield ("circle", f.center.x.value, f.center.y.value, abs(f.radius.var.value))
+
+def bounds(fs):
+    # Scene-space (xmin, ymin, xmax, ymax) of the exported geometry, in one pass
+    (xmin, ymin, xmax, ymax) = (np.inf, np.inf, -np.inf, -np.inf)
+    for g in geometry(fs):
+        if g[0] == "line":
+            (x1, y1, x2, y2) = g[1:]
+            (xmin, ymin, xmax, ymax) = (min(xmin, x1, x2), min(ymin, y1, y2), max(xmax, x1, x2), max(ymax, y1, y2))
+        else:
+            (cx, cy, r) = g[1:4]
+            (xmin, ymin, xmax, ymax) = (min(xmin, cx - r), min(ymin, cy - r), max(xmax, cx + r), max(ymax, cy + r))
+    if xmin > xmax:
+        return (0., 0., 0., 0.)
+    return (xmin, ymin, xmax, ymax)
+
+def write_svg(fs, out):
+    # Write the features to a text stream as SVG. Scene and SVG share
+    # the same y-down orientation. Features are read twice (once for the
+    # bounds) and written one at a time, so memory use does not grow.
+    (xmin, ymin, xmax, ymax) = bounds(fs)
+    (x, y) = (xmin - SVG_MARGIN, ymin - SVG_MARGIN)
+    (w, h) = (xmax - xmin + 2 * SVG_MARGIN, ymax - ymin + 2 * SVG_MARGIN)
+    out.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    out.write('<svg xmlns="http://www.w3.org/2000/svg" viewBox="{:g} {:g} {:g} {:g}" width="{:g}" height="{:g}">\n'.format(x, y, w, h, w, h))
+    out.write('<g fill="none" stroke="black" stroke-width="1" vector-effect="non-scaling-stroke">\n')
+    for g in geometry(fs):
+        if g[0] == "line":
+            out.write('<line x1="{:.6g}" y1="{:.6g}" x2="{:.6g}" y2="{:.6g}"/>\n'.format(*g[1:]))
+        elif g[0] == "circle":
+            out.write('<circle cx="{:.6g}" cy="{:.6g}" r="{:.6g}"/>\n'.format(*g[1:]))
+        elif g[0] == "arc":
+            (cx, cy, r, start, end) = g[1:]
+            large = 1 if end - start > np.pi else 0
+            out.write('<path d="M {:.6g} {:.6g} A {:.6g} {:.6g} 0 {} 1 {:.6g} {:.6g}"/>\n'.format(
+                cx + r * np.cos(start), cy + r * np.sin(start), r, r, large, cx + r * np.cos(end), cy + r * np.sin(end)))
+    out.write('</g>\n</svg>\n')
+
+def write_dxf(fs, out):
+    # Write the features to a text stream as R12 ASCII DXF entities.
+    # DXF is y-up, so y is negated (which also reverses arc directions).
+    out.write("0\nSECTION\n2\nENTITIES\n")
+    for g in geometry(fs):
+        if g[0] == "line":
+            (x1, y1, x2, y2) = g[1:]
+            out.write("0\nLINE\n8\n0\n10\n{:.9g}\n20\n{:.9g}\n30\n0\n11\n{:.9g}\n21\n{:.9g}\n31\n0\n".format(x1, -y1, x2, -y2))
+        elif g[0] == "circle":
+            (cx, cy, r) = g[1:]
+            out.write("0\nCIRCLE\n8\n0\n10\n{:.9g}\n20\n{:.9g}\n30\n0\n40\n{:.9g}\n".format(cx, -cy, r))
+        elif g[0] == "arc":
+            (cx, cy, r, start, end) = g[1:]
+            out.write("0\nARC\n8\n0\n10\n{:.9g}\n20\n{:.9g}\n30\n0\n40\n{:.9g}\n50\n{:.9g}\n51\n{:.9g}\n".format(
+                cx, -cy, r, np.degrees(-end) % 360, np.degrees(-start) % 360))
+    out.write("0\nENDSEC\n0\nEOF\n")
+
+writers = {
+    "svg": write_svg,
+    "dxf": write_dxf,
+}
+
+def export(fs, filename):
+    # Write the features to a file, choosing the format by its extension
+    extension = os.path.splitext(filename)[1][1:].lower()
+    if extension not in writers:
+        raise ValueError("Unknown export format: {}".format(extension))
+    with open(filename, "w") as out:
+        writers[extension](fs, out)
+
+def main(argv):
+    # Headless export: python export.py SKETCH.py OUTPUT.svg|OUTPUT.dxf
+    # where SKETCH.py builds a sketch and names it "scene"
+    # (anything with "features" and "constraints" lists).
+    if len(argv) != 3:
+        sys.stderr.write("usage: {} SKETCH.py OUTPUT.svg|OUTPUT.dxf\n".format(argv[0]))
+        return 2
+    scene = runpy.run_path(argv[1])["scene"]
+    try:
+        solver.solve(scene.constraints)
+    except solver.SolverException as e:
+        sys.stderr.write("warning: {}\n".format(e))
+    export(scene.features, argv[2])
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -1,9 +1,11 @@
 from solver import Variable
 from PyQt5 import QtWidgets
 from PyQt5 import QtGui
+from PyQt5 import QtCore
 from PyQt5.QtCore import Qt
 import numpy as np
 import features
+import constraints
 
 class FeatureCreator:
     def __init__(self, canvas):
@@ -35,65 +37,215 @@ class FeatureCreator:
     def draw(self, canvas, event, qp):
         pass
 
+    def place(self, canvas, point, point_new, point_constraints):
+        # Add a point placed by a snap, and the constraints the snap inferred
+        if point_new:
+            canvas.scene.add_feature(point)
+        for c in point_constraints:
+            canvas.scene.add_constraint(c)
+
+    def draw_snap(self, canvas, qp, snap):
+        # Mark what the cursor snapped to, with guides to aligned points
+        if snap is None:
+            return
+        (x, y) = (canvas.xfx(snap.pos[0]), canvas.xfy(snap.pos[1]))
+        pen = QtGui.QPen(canvas.line_color_selected, 1, Qt.DashLine)
+        qp.setPen(pen)
+        for (constraint_class, q) in snap.aligned:
+            qp.drawLine(QtCore.QLineF(x, y, canvas.xfx(q.x.value), canvas.xfy(q.y.value)))
+        if snap.kind is not None:
+            pen.setStyle(Qt.SolidLine)
+            qp.setPen(pen)
+            qp.drawEllipse(QtCore.QPointF(x, y), 6, 6)
+
 class PointCreator(FeatureCreator):
     def init(self, canvas):
         self.point = features.Point(0, 0)
+        self.snap = None
 
     def mousePressEvent(self, canvas, pos):
-        canvas.scene.add_feature(self.point)
-        self.point = features.Point(0, 0)
+        self.snap = canvas.snap(pos)
+        (point, point_constraints) = self.snap.place()
+        self.place(canvas, point, self.snap.kind != "endpoint", point_constraints)
         canvas.update()
 
     def mouseMoveEvent(self, canvas, pos):
-        (self.point.x.value, self.point.y.value) = tuple(pos)
-        canvas.update()
+        self.snap = canvas.snap(pos)
+        (self.point.x.value, self.point.y.value) = tuple(self.snap.pos)
+        canvas.update_view()
 
     def draw(self, canvas, event, qp):
         self.point.draw(canvas, event, qp)
+        self.draw_snap(canvas, qp, self.snap)
 
 class LineCreator(FeatureCreator):
     def init(self, canvas):
         self.pt1 = None
         self.mouse = None
+        self.snap = None
+
+    def snap_at(self, canvas, pos):
+        if self.pt1 is None:
+            return canvas.snap(pos)
+        # Don't snap onto the first point, but do align with it
+        return canvas.snap(pos, exclude=(self.pt1,), extra=(self.pt1,) if self.pt1_new else ())
 
     def mousePressEvent(self, canvas, pos):
+        self.snap = self.snap_at(canvas, pos)
+        (pt, pt_constraints) = self.snap.place()
         if self.pt1 is None:
-            f = canvas.hit(pos)
-            if f is not None and isinstance(f, features.Point):
-                self.pt1 = f
-                self.pt1_new = False
-            else:
-                self.pt1 = features.Point(*tuple(pos))
-                self.pt1_new = True
-            self.mouse = pos
+            self.pt1 = pt
+            self.pt1_new = self.snap.kind != "endpoint"
+            self.pt1_constraints = pt_constraints
+            self.mouse = self.snap.pos
             canvas.update()
         else:
-            f = canvas.hit(pos)
-            if f is not None and isinstance(f, features.Point):
-                pt2 = f
-            else:
-                pt2 = features.Point(*tuple(pos))
-                canvas.scene.add_feature(pt2)
-            line = features.Line(self.pt1, pt2)
-            line.depends_on((self.pt1, pt2))
-            if self.pt1_new:
-                canvas.scene.add_feature(self.pt1)
-            canvas.scene.add_feature(line)
+            self.place(canvas, self.pt1, self.pt1_new, self.pt1_constraints)
+            self.place(canvas, pt, self.snap.kind != "endpoint", pt_constraints)
+            canvas.scene.add_feature(features.Line(self.pt1, pt))
             self.pt1 = None
+            self.mouse = None
             canvas.update()
 
     def mouseMoveEvent(self, canvas, pos):
+        self.snap = self.snap_at(canvas, pos)
         if self.mouse is not None:
-            self.mouse = pos
-            canvas.update()
+            self.mouse = self.snap.pos
+        canvas.update_view()
 
     def draw(self, canvas, event, qp):
         if self.pt1 is not None:
             qp.setPen(QtGui.QPen(canvas.line_color, canvas.line_width))
-            qp.drawLine(canvas.xfx(self.pt1.x.value), canvas.xfy(self.pt1.y.value), canvas.xfx(self.mouse[0]), canvas.xfy(self.mouse[1]))
+            qp.drawLine(QtCore.QLineF(canvas.xfx(self.pt1.x.value), canvas.xfy(self.pt1.y.value), canvas.xfx(self.mouse[0]), canvas.xfy(self.mouse[1])))
             self.pt1.draw(canvas, event, qp)
+        self.draw_snap(canvas, qp, self.snap)
+
+class CircleCreator(FeatureCreator):
+    def init(self, canvas):
+        self.center = None
+        self.mouse = None
+        self.snap = None
+
+    def mousePressEvent(self, canvas, pos):
+        if self.center is None:
+            snap = canvas.snap(pos)
+            (self.center, self.center_constraints) = snap.place()
+            self.center_new = snap.kind != "endpoint"
+            self.mouse = snap.pos
+            self.snap = None
+            canvas.update()
+        else:
+            radius = features.Scalar(self.radius())
+            circle = self.create(canvas, radius)
+            self.place(canvas, self.center, self.center_new, self.center_constraints)
+            canvas.scene.add_feature(radius)
+            canvas.scene.add_feature(circle)
+            self.center = None
+            canvas.update()
+
+    def mouseMoveEvent(self, canvas, pos):
+        if self.center is None:
+            # Show where the center would snap to
+            self.snap = canvas.snap(pos)
+        else:
+            self.mouse = pos
+        canvas.update_view()
+
+    def radius(self):
+        return np.linalg.norm(self.mouse - np.array([self.center.x.value, self.center.y.value]))
+
+    def create(self, canvas, radius):
+        return features.Circle(self.center, radius)
+
+    def draw(self, canvas, event, qp):
+        if self.center is not None:
+            r = self.radius() * canvas.scale
+            qp.setPen(QtGui.QPen(canvas.line_color, canvas.line_width))
+            qp.drawEllipse(QtCore.QPointF(canvas.xfx(self.center.x.value), canvas.xfy(self.center.y.value)), r, r)
+            self.center.draw(canvas, event, qp)
+        self.draw_snap(canvas, qp, self.snap)
+
+class ArcCreator(CircleCreator):
+    # Click the center, then the start of the arc, then the end.
+    # The endpoints snap like the ends of a line, so an arc can start or end
+    # on an existing point, and are held on the arc by PointOnCircle constraints.
+    def init(self, canvas):
+        super().init(canvas)
+        self.start = None
+
+    def snap_at(self, canvas, pos):
+        if self.start is None:
+            return canvas.snap(pos, exclude=(self.center,))
+        return canvas.snap(pos, exclude=(self.center, self.start))
+
+    def mousePressEvent(self, canvas, pos):
+        if self.center is None:
+            super().mousePressEvent(canvas, pos)
+        elif self.start is None:
+            snap = self.snap_at(canvas, pos)
+            (self.start, self.start_constraints) = snap.place()
+            self.start_new = snap.kind != "endpoint"
+            self.mouse = snap.pos
+            self.snap = None
+            canvas.update()
+        else:
+            # The end is on the circle through the start, unless it snapped to a point
+            snap = self.snap_at(canvas, pos)
+            if snap.kind == "endpoint":
+                (end, end_new) = (snap.features[0], False)
+            else:
+                (end, end_new) = (features.Point(*tuple(self.on_circle(pos))), True)
+            radius = features.Scalar(self.radius())
+            arc = features.Arc(self.center, radius, self.start, end)
+            self.place(canvas, self.center, self.center_new, self.center_constraints)
+            self.place(canvas, self.start, self.start_new, self.start_constraints)
+            self.place(canvas, end, end_new, [])
+            canvas.scene.add_feature(radius)
+            canvas.scene.add_feature(arc)
+            for p in (self.start, end):
+                canvas.scene.add_constraint(constraints.PointOnCircle(p, arc))
+            self.center = None
+            self.start = None
+            self.snap = None
+            canvas.update()
+
+    def mouseMoveEvent(self, canvas, pos):
+        if self.center is None:
+            super().mouseMoveEvent(canvas, pos)
+            return
+        self.snap = self.snap_at(canvas, pos)
+        self.mouse = self.snap.pos
+        canvas.update_view()
+
+    def radius(self):
+        if self.start is None:
+            return super().radius()
+        return np.hypot(self.start.x.value - self.center.x.value, self.start.y.value - self.center.y.value)
+
+    def angle(self, p):
+        return np.arctan2(p[1] - self.center.y.value, p[0] - self.center.x.value)
+
+    def on_circle(self, p):
+        a = self.angle(p)
+        return np.array([self.center.x.value, self.center.y.value]) + self.radius() * np.array([np.cos(a), np.sin(a)])
+
+    def draw(self, canvas, event, qp):
+        if self.start is None:
+            super().draw(canvas, event, qp)
+            return
+        r = self.radius() * canvas.scale
+        rect = QtCore.QRectF(canvas.xfx(self.center.x.value) - r, canvas.xfy(self.center.y.value) - r, 2 * r, 2 * r)
+        start = self.angle((self.start.x.value, self.start.y.value))
+        span = (self.angle(self.mouse) - start) % (2 * np.pi)
+        qp.setPen(QtGui.QPen(canvas.line_color, canvas.line_width))
+        qp.drawArc(rect, int(round(-np.degrees(start) * 16)), int(round(-np.degrees(span) * 16)))
+        self.center.draw(canvas, event, qp)
+        self.start.draw(canvas, event, qp)
+        self.draw_snap(canvas, qp, self.snap)
 
 available = (
     PointCreator,
-    LineCreator
+    LineCreator,
+    CircleCreator,
+    ArcCreator
 )
@@ -1,20 +1,52 @@
 from solver import Variable
 from PyQt5 import QtWidgets
 from PyQt5 import QtGui
+from PyQt5 import QtCore
 from PyQt5.QtCore import Qt
 import numpy as np
 
 class Feature:
     def __init__(self, scene=None):
-        self.selected = False
         self.scene = scene
         self.constraints = []
         self.dependents = []
         self.dependees = []
 
+    @property
+    def selected(self):
+        return self.scene is not None and self in self.scene.selection
+
     def draw(self, canvas, event, qp, **kwargs):
         pass
 
+    def hit(self, canvas, pos):
+        return False
+
+    def start_drag(self, canvas, pos):
+        pass
+
+    def drag(self, canvas, pos):
+        pass
+
+    @property
+    def drag_variables(self):
+        # Variables moved by drag()
+        return ()
+
+    def cache_geometry(self, cache):
+        # Contribute to a render.RenderCache; by default the feature draws itself
+        cache.add_other(self)
+
+    def bounds(self):
+        # Scene-space (xmin, ymin, xmax, ymax), or None to always draw
+        return None
+
+    def visible(self, bounds):
+        b = self.bounds()
+        if b is None:
+            return True
+        return b[0] <= bounds[2] and b[2] >= bounds[0] and b[1] <= bounds[3] and b[3] >= bounds[1]
+
     def delete(self):
         for c in self.constraints[:]:
             if c in self.constraints:
@@ -28,6 +60,7 @@ class Feature:
 
         if self.scene is not None and self in self.scene.features:
             self.scene.features.remove(self)
+            self.scene.selection.discard(self)
 
         # Do not use this object after this point
         self.scene = None
@@ -53,7 +86,19 @@ class Scalar(Feature):
         self.var = Variable(val)
 
     def __str__(self):
-        return "{}({:.3f})".format(self.__class__.__name__, self.x.value)
+        return "{}({:.3f})".format(self.__class__.__name__, self.var.value)
+
+class Parameter(Scalar):
+    # A named driving dimension. Constraints that take a value (e.g.
+    # FixedDistance, FixedX) may be given a Parameter instead of a number,
+    # and then follow it; the solver never changes a Parameter.
+    def __init__(self, name, val, **kwargs):
+        super().__init__(val, **kwargs)
+        self.name = name
+        self.var.name = name
+
+    def __str__(self):
+        return "{}({} = {:.3f})".format(self.__class__.__name__, self.name, self.var.value)
 
 class Point(Feature):
     def __init__(self, x, y, **kwargs):
@@ -67,14 +112,20 @@ class Point(Feature):
 
     def draw(self, canvas, event, qp, **kwargs):
         selected = kwargs.get("selected", self.selected)
-        params = (canvas.xfx(self.x.value) - self.handle_size / 2, canvas.xfy(self.y.value) - self.handle_size / 2, self.handle_size, self.handle_size)
-        qp.setPen(QtGui.QPen(canvas.line_color_selected if selected else canvas.line_color, canvas.line_width))
-        qp.fillRect(*params, canvas.bg_color)
-        qp.drawRect(*params)
+        rect = QtCore.QRectF(canvas.xfx(self.x.value) - self.handle_size / 2, canvas.xfy(self.y.value) - self.handle_size / 2, self.handle_size, self.handle_size)
+        qp.setPen(QtGui.QPen(kwargs.get("color", canvas.line_color_selected if selected else canvas.line_color), canvas.line_width))
+        qp.fillRect(rect, canvas.bg_color)
+        qp.drawRect(rect)
+
+    def cache_geometry(self, cache):
+        cache.add_point(self, self.x.value, self.y.value, self.handle_size, self.selected)
 
     def hit(self, canvas, pos):
         return np.all(np.abs(pos - np.array([canvas.xfx(self.x.value), canvas.xfy(self.y.value)])) < self.handle_size / 2)
 
+    def bounds(self):
+        return (self.x.value, self.y.value, self.x.value, self.y.value)
+
     def start_drag(self, canvas, pos):
         self.drag_start_mouse = pos
         self.drag_start_point = np.array([self.x.value, self.y.value])
@@ -84,6 +135,10 @@ class Point(Feature):
         self.x.value = new_pos[0]
         self.y.value = new_pos[1]
 
+    @property
+    def drag_variables(self):
+        return (self.x, self.y)
+
 class Line(Feature):
     def __init__(self, p1, p2, **kwargs):
         super().__init__(**kwargs)
@@ -95,8 +150,11 @@ class Line(Feature):
     def draw(self, canvas, event, qp, **kwargs):
         selected = kwargs.get("selected", self.selected)
 
-        qp.setPen(QtGui.QPen(canvas.line_color_selected if selected else canvas.line_color, canvas.line_width))
-        qp.drawLine(canvas.xfx(self.p1.x.value), canvas.xfy(self.p1.y.value), canvas.xfx(self.p2.x.value), canvas.xfy(self.p2.y.value))
+        qp.setPen(QtGui.QPen(kwargs.get("color", canvas.line_color_selected if selected else canvas.line_color), canvas.line_width))
+        qp.drawLine(QtCore.QLineF(canvas.xfx(self.p1.x.value), canvas.xfy(self.p1.y.value), canvas.xfx(self.p2.x.value), canvas.xfy(self.p2.y.value)))
+
+    def cache_geometry(self, cache):
+        cache.add_segment(self, self.p1.x.value, self.p1.y.value, self.p2.x.value, self.p2.y.value, self.selected)
 
     def hit(self, canvas, pos):
         p1 = np.array([canvas.xfx(self.p1.x.value), canvas.xfy(self.p1.y.value)])
@@ -110,6 +168,10 @@ class Line(Feature):
         hit = v > 0 and v < 1 and n < self.handle_size / 2
         return hit
 
+    def bounds(self):
+        return (min(self.p1.x.value, self.p2.x.value), min(self.p1.y.value, self.p2.y.value),
+                max(self.p1.x.value, self.p2.x.value), max(self.p1.y.value, self.p2.y.value))
+
     def start_drag(self, canvas, pos):
         self.p1.start_drag(canvas, pos)
         self.p2.start_drag(canvas, pos)
@@ -118,6 +180,10 @@ class Line(Feature):
         self.p1.drag(canvas, pos)
         self.p2.drag(canvas, pos)
 
+    @property
+    def drag_variables(self):
+        return self.p1.drag_variables + self.p2.drag_variables
+
     def split(self, canvas, pos):
         p1 = self.p1
         p3 = self.p2
@@ -133,3 +199,101 @@ class Line(Feature):
     @property
     def actions(self):
         return (("split", self.split),)
+
+
+class Circle(Feature):
+    def __init__(self, center, radius, **kwargs):
+        super().__init__(**kwargs)
+        self.center = center
+        self.radius = radius
+        self.depends_on((center, radius))
+        self.handle_size = 10
+
+    def __str__(self):
+        return "{}({:.3f}, {:.3f}, r={:.3f})".format(self.__class__.__name__, self.center.x.value, self.center.y.value, self.radius.var.value)
+
+    def draw(self, canvas, event, qp, **kwargs):
+        selected = kwargs.get("selected", self.selected)
+        r = abs(self.radius.var.value) * canvas.scale
+
+        qp.setPen(QtGui.QPen(kwargs.get("color", canvas.line_color_selected if selected else canvas.line_color), canvas.line_width))
+        qp.drawEllipse(QtCore.QPointF(canvas.xfx(self.center.x.value), canvas.xfy(self.center.y.value)), r, r)
+
+    def hit(self, canvas, pos):
+        c = np.array([canvas.xfx(self.center.x.value), canvas.xfy(self.center.y.value)])
+        r = abs(self.radius.var.value) * canvas.scale
+        return abs(np.linalg.norm(pos - c) - r) < self.handle_size / 2
+
+    def bounds(self):
+        r = abs(self.radius.var.value)
+        return (self.center.x.value - r, self.center.y.value - r, self.center.x.value + r, self.center.y.value + r)
+
+    def start_drag(self, canvas, pos):
+        self.center.start_drag(canvas, pos)
+
+    def drag(self, canvas, pos):
+        self.center.drag(canvas, pos)
+
+    @property
+    def drag_variables(self):
+        return self.center.drag_variables
+
+    def delete(self):
+        # The radius belongs to the circle, unless something else still uses it
+        radius = self.radius
+        super().delete()
+        if len(radius.dependents) == 0:
+            radius.delete()
+
+class Arc(Circle):
+    # An arc of a circle from the point p1 to the point p2. Angles are in radians,
+    # measured in scene coordinates, and the arc runs from p1 to p2 in the
+    # direction of increasing angle. The endpoints are held on the circle by
+    # PointOnCircle constraints, which are added along with the arc.
+    def __init__(self, center, radius, p1, p2, **kwargs):
+        super().__init__(center, radius, **kwargs)
+        self.p1 = p1
+        self.p2 = p2
+        self.depends_on((p1, p2))
+
+    def __str__(self):
+        return "{}({:.3f}, {:.3f}, r={:.3f}, {:.3f}-{:.3f})".format(self.__class__.__name__, self.center.x.value, self.center.y.value, self.radius.var.value, self.start_angle(), self.end_angle())
+
+    def angle(self, p):
+        return np.arctan2(p.y.value - self.center.y.value, p.x.value - self.center.x.value)
+
+    def start_angle(self):
+        return self.angle(self.p1)
+
+    def end_angle(self):
+        return self.angle(self.p2)
+
+    def span(self):
+        return (self.end_angle() - self.start_angle()) % (2 * np.pi)
+
+    def draw(self, canvas, event, qp, **kwargs):
+        selected = kwargs.get("selected", self.selected)
+        r = abs(self.radius.var.value) * canvas.scale
+        rect = QtCore.QRectF(canvas.xfx(self.center.x.value) - r, canvas.xfy(self.center.y.value) - r, 2 * r, 2 * r)
+
+        # Qt measures angles in 1/16ths of a degree, with the y axis pointing up
+        qp.setPen(QtGui.QPen(kwargs.get("color", canvas.line_color_selected if selected else canvas.line_color), canvas.line_width))
+        qp.drawArc(rect, int(round(-np.degrees(self.start_angle()) * 16)), int(round(-np.degrees(self.span()) * 16)))
+
+    def hit(self, canvas, pos):
+        if not super().hit(canvas, pos):
+            return False
+        d = pos - np.array([canvas.xfx(self.center.x.value), canvas.xfy(self.center.y.value)])
+        return (np.arctan2(d[1], d[0]) - self.start_angle()) % (2 * np.pi) <= self.span()
+
+    def start_drag(self, canvas, pos):
+        for p in (self.center, self.p1, self.p2):
+            p.start_drag(canvas, pos)
+
+    def drag(self, canvas, pos):
+        for p in (self.center, self.p1, self.p2):
+            p.drag(canvas, pos)
+
+    @property
+    def drag_variables(self):
+        return self.center.drag_variables + self.p1.drag_variables + self.p2.drag_variables
@@ -0,0 +1,131 @@
+from PyQt5 import QtGui
+from PyQt5 import QtCore
+import numpy as np
+
+# Below this zoom level, unselected point handles are not drawn
+LOD_HANDLE_SCALE = 0.25
+
+# Approximate size of a QLineF wrapper, for memory accounting
+QLINEF_BYTES = 64
+
+# Approximate size of a feature's entry in the index dictionaries
+INDEX_BYTES = 100
+
+# Segments shorter than this many pixels are merged into single pixels
+LOD_SEGMENT_PIXELS = 1.
+
+class RenderCache:
+    # Solved scene-space geometry, kept as NumPy arrays so that zooming
+    # and panning only change the painter transform and never re-solve.
+    # Rebuild it whenever the scene or its solution changes.
+
+    def __init__(self, scene):
+        self.points = []
+        self.points_size = []
+        self.points_selected = []
+        self.segments = []
+        self.segments_selected = []
+        self.others = []
+        # Index of each feature's entry in the point or segment arrays
+        self.point_index = {}
+        self.segment_index = {}
+
+        for f in scene.features:
+            f.cache_geometry(self)
+
+        self.points = np.array(self.points, dtype=float).reshape((-1, 2))
+        self.points_size = np.array(self.points_size, dtype=float)
+        self.points_selected = np.array(self.points_selected, dtype=bool)
+        self.segments = np.array(self.segments, dtype=float).reshape((-1, 4))
+        self.segments_selected = np.array(self.segments_selected, dtype=bool)
+        self.segment_lengths = np.hypot(self.segments[:, 2] - self.segments[:, 0], self.segments[:, 3] - self.segments[:, 1])
+        self.segment_lines = [QtCore.QLineF(*s) for s in self.segments]
+
+    @property
+    def nbytes(self):
+        return (self.points.nbytes + self.points_size.nbytes + self.points_selected.nbytes +
+                self.segments.nbytes + self.segments_selected.nbytes + self.segment_lengths.nbytes +
+                len(self.segment_lines) * QLINEF_BYTES + (len(self.point_index) + len(self.segment_index)) * INDEX_BYTES)
+
+    def add_point(self, feature, x, y, size, selected):
+        self.point_index[feature] = len(self.points)
+        self.points.append((x, y))
+        self.points_size.append(size)
+        self.points_selected.append(selected)
+
+    def add_segment(self, feature, x1, y1, x2, y2, selected):
+        self.segment_index[feature] = len(self.segments)
+        self.segments.append((x1, y1, x2, y2))
+        self.segments_selected.append(selected)
+
+    def add_other(self, feature):
+        self.others.append(feature)
+
+    def set_selected(self, fs, selected):
+        # Update the selection state of cached features, without a rebuild.
+        # Other features draw themselves, so they are always up to date.
+        for f in fs:
+            if f in self.point_index:
+                self.points_selected[self.point_index[f]] = selected
+            elif f in self.segment_index:
+                self.segments_selected[self.segment_index[f]] = selected
+
+    def draw(self, canvas, event, qp):
+        bounds = canvas.visible_bounds(event)
+
+        for f in reversed(self.others):
+            if f.visible(bounds):
+                f.draw(canvas, event, qp)
+
+        self.draw_segments(canvas, bounds, qp)
+        self.draw_points(canvas, bounds, qp)
+
+    def pen(self, canvas, selected):
+        pen = QtGui.QPen(canvas.line_color_selected if selected else canvas.line_color, canvas.line_width)
+        pen.setCosmetic(True)
+        return pen
+
+    def draw_segments(self, canvas, bounds, qp):
+        s = self.segments
+        visible = ((np.minimum(s[:, 0], s[:, 2]) <= bounds[2]) & (np.maximum(s[:, 0], s[:, 2]) >= bounds[0]) &
+                   (np.minimum(s[:, 1], s[:, 3]) <= bounds[3]) & (np.maximum(s[:, 1], s[:, 3]) >= bounds[1]))
+        long_enough = self.segment_lengths * canvas.scale >= LOD_SEGMENT_PIXELS
+
+        # Full segments are drawn in scene space under the view transform
+        qp.save()
+        qp.setTransform(QtGui.QTransform(canvas.scale, 0, 0, canvas.scale,
+                                         canvas.translate[0] * canvas.scale,
+                                         canvas.translate[1] * canvas.scale), True)
+        for selected in (False, True):
+            indices = np.flatnonzero(visible & long_enough & (self.segments_selected == selected))
+            if len(indices) > 0:
+                qp.setPen(self.pen(canvas, selected))
+                qp.drawLines([self.segment_lines[i] for i in indices])
+        qp.restore()
+
+        # Sub-pixel segments are merged by the screen pixel they fall in
+        for selected in (False, True):
+            mask = visible & ~long_enough & (self.segments_selected == selected)
+            if not np.any(mask):
+                continue
+            midpoints = (s[mask, 0:2] + s[mask, 2:4]) / 2
+            pixels = np.unique(np.floor((midpoints + canvas.translate) * canvas.scale), axis=0)
+            qp.setPen(self.pen(canvas, selected))
+            qp.drawPoints(QtGui.QPolygonF([QtCore.QPointF(*p) for p in pixels]))
+
+    def draw_points(self, canvas, bounds, qp):
+        p = self.points
+        visible = (p[:, 0] >= bounds[0]) & (p[:, 0] <= bounds[2]) & (p[:, 1] >= bounds[1]) & (p[:, 1] <= bounds[3])
+        if canvas.scale < LOD_HANDLE_SCALE:
+            visible &= self.points_selected
+
+        # Handles are a fixed size on screen, so they are drawn in screen space
+        size = self.points_size
+        corners = (p + canvas.translate) * canvas.scale - size[:, None] / 2
+        qp.setBrush(canvas.bg_color)
+        for selected in (False, True):
+            indices = np.flatnonzero(visible & (self.points_selected == selected))
+            if len(indices) > 0:
+                qp.setPen(self.pen(canvas, selected))
+                qp.drawRects([QtCore.QRectF(corners[i, 0], corners[i, 1], size[i], size[i]) for i in indices])
+        qp.setBrush(QtCore.Qt.NoBrush)
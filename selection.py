@@ -0,0 +1,100 @@
+class Selection:
+    # The selected items (features or constraints) of a scene, as an ordered
+    # set in the order they were selected. Operations cost time in proportion
+    # to the items they change, except the bulk ones that look at every item.
+    #
+    # Listeners are called as listener(added, removed) with lists of items,
+    # once per operation that changes anything, so views only need to
+    # update the affected items.
+
+    def __init__(self, scene, attribute):
+        # Items that can be selected are the list scene.<attribute>
+        self.scene = scene
+        self.attribute = attribute
+        self.selected = {}
+        self.listeners = []
+
+    def items(self):
+        return getattr(self.scene, self.attribute)
+
+    def connect(self, listener):
+        self.listeners.append(listener)
+
+    def disconnect(self, listener):
+        self.listeners.remove(listener)
+
+    def __contains__(self, item):
+        return item in self.selected
+
+    def __iter__(self):
+        # Iterate over a copy, so items can be deleted along the way
+        return iter(list(self.selected))
+
+    def __len__(self):
+        return len(self.selected)
+
+    def change(self, add=(), remove=()):
+        # Deselect the items in remove, then select the items in add
+        removed = []
+        for item in remove:
+            if item in self.selected:
+                del self.selected[item]
+                removed.append(item)
+        added = []
+        for item in add:
+            if item not in self.selected:
+                self.selected[item] = None
+                added.append(item)
+        if len(added) > 0 or len(removed) > 0:
+            for listener in self.listeners[:]:
+                listener(added, removed)
+
+    def add(self, *items):
+        self.change(add=items)
+
+    def discard(self, *items):
+        self.change(remove=items)
+
+    def toggle(self, item):
+        if item in self.selected:
+            self.change(remove=(item,))
+        else:
+            self.change(add=(item,))
+
+    def replace(self, items):
+        # Select exactly the given items
+        items = list(items)
+        keep = set(items)
+        self.change(add=items, remove=[item for item in self.selected if item not in keep])
+
+    def clear(self):
+        self.change(remove=list(self.selected))
+
+    def select_all(self):
+        self.change(add=self.items())
+
+    def invert(self):
+        self.change(add=[item for item in self.items() if item not in self.selected], remove=list(self.selected))
+
+    def select_type(self, *classes):
+        # Select exactly the items that are instances of the given classes
+        self.replace(item for item in self.items() if isinstance(item, classes))
+
+    def select_connected(self):
+        # Grow the selection to the connected components it touches. Features
+        # are connected to their constraints and to the features they are built
+        # from or on (e.g. a line and its endpoints); constraints are connected
+        # to their features.
+        seen = set(self.selected)
+        stack = list(self.selected)
+        while len(stack) > 0:
+            item = stack.pop()
+            for neighbour in neighbours(item):
+                if neighbour not in seen:
+                    seen.add(neighbour)
+                    stack.append(neighbour)
+        self.change(add=[item for item in self.items() if item in seen])
+
+def neighbours(item):
+    return (list(getattr(item, "constraints", ())) + list(getattr(item, "features", ())) +
+            list(getattr(item, "dependents", ())) + list(getattr(item, "dependees", ())))
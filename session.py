@@ -0,0 +1,136 @@
+import os
+import sys
+import time
+import numpy as np
+
+# First line of every session file
+HEADER = "pancake-session 1"
+
+# Recorded events: kind -> (code, argument types)
+# Positions are in scene coordinates.
+EVENTS = {
+    "view": ("v", (float, float, float)),   # scale, translate x, translate y
+    "press": ("p", (float, float, int)),    # left button: x, y, keyboard modifiers
+    "release": ("r", (float, float)),       # left button: x, y
+    "move": ("m", (float, float)),          # x, y
+    "key": ("k", (int,)),                   # Qt key code
+    "menu": ("c", (float, float, str)),     # context menu choice: x, y, item name
+    "create": ("n", (str,)),                # feature creator class name
+}
+
+KINDS = {code: (kind, types) for (kind, (code, types)) in EVENTS.items()}
+
+class Recorder:
+    # Logs the input events of a Canvas to a text stream, one event per line:
+    # a one-letter code followed by its arguments. Floats are written in full
+    # precision, so a replay takes exactly the same code paths.
+    # Hit testing and snapping are measured in screen pixels, so the view
+    # (zoom and pan) is logged before any event it changed for.
+
+    def __init__(self, out):
+        self.out = out
+        self.view = None
+        out.write(HEADER + "\n")
+
+    def record(self, canvas, kind, *args):
+        view = (float(canvas.scale), float(canvas.translate[0]), float(canvas.translate[1]))
+        if view != self.view:
+            self.write("view", *view)
+            self.view = view
+        self.write(kind, *args)
+
+    def write(self, kind, *args):
+        (code, types) = EVENTS[kind]
+        self.out.write(" ".join([code] + [repr(t(a)) if t is float else str(t(a)) for (t, a) in zip(types, args)]) + "\n")
+
+    def close(self):
+        self.out.close()
+
+def read(lines):
+    # Parse a session, yielding (kind, args) for each event
+    lines = iter(lines)
+    if next(lines, "").strip() != HEADER:
+        raise ValueError("Not a session file")
+    for line in lines:
+        if line.strip() == "":
+            continue
+        (kind, types) = KINDS[line[0]]
+        # The last field may be a name containing spaces
+        fields = line.rstrip("\n").split(" ", len(types))[1:]
+        yield (kind, tuple(t(field) for (t, field) in zip(types, fields)))
+
+def replay(canvas, events, creators=()):
+    # Feed events to a Canvas as fast as possible. After each one, the canvas
+    # is brought up to date as the next paint would (re-solving if needed,
+    # and waiting for the solve), but nothing is drawn. creators are the FeatureCreator classes that
+    # "create" events may name.
+    #
+    # Returns a list of (kind, args, seconds) with the latency of each event.
+    creators = {c.__name__: c for c in creators}
+    latencies = []
+    for (kind, args) in events:
+        start = time.perf_counter()
+        if kind == "view":
+            canvas.scale = args[0]
+            canvas.translate = np.array(args[1:])
+        elif kind == "press":
+            canvas.press(np.array(args[:2]), args[2])
+        elif kind == "release":
+            canvas.release(np.array(args))
+        elif kind == "move":
+            canvas.move(np.array(args))
+        elif kind == "key":
+            canvas.key(args[0])
+        elif kind == "menu":
+            canvas.choose(np.array(args[:2]), args[2])
+        elif kind == "create":
+            canvas.start_create(creators[args[0]])
+        canvas.finish()
+        latencies.append((kind, args, time.perf_counter() - start))
+    return latencies
+
+def report(latencies, slowest=10, out=None):
+    # Summarize latencies by kind of event, then list the slowest events
+    if out is None:
+        out = sys.stdout
+    if len(latencies) == 0:
+        out.write("no events\n")
+        return
+    out.write("{:<8} {:>7} {:>10} {:>10} {:>10} {:>10}\n".format("event", "count", "total ms", "mean ms", "p95 ms", "max ms"))
+    kinds = sorted(set(kind for (kind, args, t) in latencies))
+    for kind in kinds + ["all"]:
+        t = np.array([t for (k, args, t) in latencies if kind in (k, "all")]) * 1e3
+        out.write("{:<8} {:>7} {:>10.2f} {:>10.3f} {:>10.3f} {:>10.3f}\n".format(
+            kind, len(t), np.sum(t), np.mean(t), np.percentile(t, 95), np.max(t)))
+    if slowest > 0:
+        out.write("\nslowest events:\n")
+        order = sorted(range(len(latencies)), key=lambda i: -latencies[i][2])
+        for i in order[:slowest]:
+            (kind, args, t) = latencies[i]
+            out.write("{:>7} {:>10.3f} ms  {} {}\n".format(i + 1, t * 1e3, kind, " ".join(str(a) for a in args)))
+
+def main(argv):
+    # Headless replay: python session.py SESSION
+    # Replays a session recorded from a new sketch and reports per-event latency.
+    # Event numbers count events in the file, starting at 1.
+    if len(argv) != 2:
+        sys.stderr.write("usage: {} SESSION\n".format(argv[0]))
+        return 2
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5 import QtWidgets
+    import app
+    import featurecreator
+    from workspace import Workspace
+
+    application = QtWidgets.QApplication.instance() or QtWidgets.QApplication(argv[:1])
+    workspace = Workspace()
+    document = app.Document(workspace)
+    with open(argv[1]) as f:
+        latencies = replay(document.canvas, read(f), featurecreator.available)
+    report(latencies)
+    document.release()
+    workspace.shutdown()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
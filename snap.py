@@ -0,0 +1,246 @@
+import bisect
+import numpy as np
+import features
+import constraints
+
+# How close, in screen pixels, the cursor must be to snap
+SNAP_PIXELS = 10
+
+# Side of a spatial index cell, in scene units
+CELL_SIZE = 64.
+
+# Items covering more cells than this are kept in a list that every query returns
+MAX_CELLS = 256
+
+class GridIndex:
+    # A uniform-grid spatial hash from keys to scene-space bounding boxes
+
+    def __init__(self, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.large = set()
+        self.bounds = {}
+
+    def cell_range(self, bounds):
+        (x1, y1, x2, y2) = (int(np.floor(b / self.cell_size)) for b in bounds)
+        return (x1, y1, x2, y2)
+
+    def insert(self, key, bounds):
+        self.remove(key)
+        self.bounds[key] = bounds
+        (x1, y1, x2, y2) = self.cell_range(bounds)
+        if (x2 - x1 + 1) * (y2 - y1 + 1) > MAX_CELLS:
+            self.large.add(key)
+            return
+        for i in range(x1, x2 + 1):
+            for j in range(y1, y2 + 1):
+                self.cells.setdefault((i, j), set()).add(key)
+
+    def remove(self, key):
+        bounds = self.bounds.pop(key, None)
+        if bounds is None:
+            return
+        if key in self.large:
+            self.large.remove(key)
+            return
+        (x1, y1, x2, y2) = self.cell_range(bounds)
+        for i in range(x1, x2 + 1):
+            for j in range(y1, y2 + 1):
+                cell = self.cells[(i, j)]
+                cell.discard(key)
+                if len(cell) == 0:
+                    del self.cells[(i, j)]
+
+    def query(self, bounds):
+        # All keys whose bounding boxes may overlap the given one
+        (x1, y1, x2, y2) = self.cell_range(bounds)
+        found = set(self.large)
+        if (x2 - x1 + 1) * (y2 - y1 + 1) > len(self.cells):
+            # Zoomed far out, the query covers more cells than are occupied
+            for ((i, j), keys) in self.cells.items():
+                if x1 <= i <= x2 and y1 <= j <= y2:
+                    found |= keys
+            return found
+        for i in range(x1, x2 + 1):
+            for j in range(y1, y2 + 1):
+                found |= self.cells.get((i, j), set())
+        return found
+
+def intersection(l1, l2):
+    # Intersection point of two line segments, or None
+    (p, r) = (np.array([l1.p1.x.value, l1.p1.y.value]), np.array([l1.p2.x.value - l1.p1.x.value, l1.p2.y.value - l1.p1.y.value]))
+    (q, s) = (np.array([l2.p1.x.value, l2.p1.y.value]), np.array([l2.p2.x.value - l2.p1.x.value, l2.p2.y.value - l2.p1.y.value]))
+    denominator = r[0] * s[1] - r[1] * s[0]
+    if abs(denominator) < 1e-12:
+        return None
+    t = ((q[0] - p[0]) * s[1] - (q[1] - p[1]) * s[0]) / denominator
+    u = ((q[0] - p[0]) * r[1] - (q[1] - p[1]) * r[0]) / denominator
+    if not (0 < t < 1 and 0 < u < 1):
+        return None
+    return p + t * r
+
+class Snap:
+    # Where a click at the cursor should place a point, and why.
+    # kind is "endpoint", "midpoint", "intersection" or None;
+    # aligned holds (constraint class, point) pairs for horizontal and
+    # vertical alignment with existing points.
+
+    def __init__(self, pos, kind=None, fs=(), aligned=()):
+        self.pos = np.array(pos, dtype=float)
+        self.kind = kind
+        self.features = tuple(fs)
+        self.aligned = tuple(aligned)
+
+    def place(self):
+        # Returns the Point to use, which is new unless snapped to an endpoint,
+        # and the constraints to add once it has been added to the scene
+        if self.kind == "endpoint":
+            return (self.features[0], [])
+        p = features.Point(*tuple(self.pos))
+        cs = []
+        if self.kind == "midpoint":
+            cs.append(constraints.Midpoint(p, self.features[0]))
+        elif self.kind == "intersection":
+            cs += [constraints.PointOnLine(p, l) for l in self.features]
+        cs += [constraint_class(p, q) for (constraint_class, q) in self.aligned]
+        return (p, cs)
+
+class Snapper:
+    # Snap candidates (endpoints, midpoints and line-line intersections)
+    # for a scene, kept in spatial indices and updated incrementally:
+    # sync() only recomputes candidates for features that were added,
+    # removed or moved since the last sync, and intersections are only
+    # computed between lines whose bounding boxes share an index cell.
+    # The sorted point coordinates used for alignment are updated the same way.
+
+    def __init__(self, scene, cell_size=CELL_SIZE):
+        self.scene = scene
+        self.lines = GridIndex(cell_size)
+        self.candidates = GridIndex(cell_size)
+        self.candidate_info = {}
+        self.geometry = {}
+        self.intersections = {}
+        # Sorted (coordinate, number, point) for alignment queries, where the
+        # number is unique to the point and keeps points from being compared
+        self.xs = []
+        self.ys = []
+        self.numbers = {}
+        self.count = 0
+        self.stale = True
+
+    def invalidate(self):
+        self.stale = True
+
+    def feature_geometry(self, f):
+        if isinstance(f, features.Point):
+            return (f.x.value, f.y.value)
+        if isinstance(f, features.Line):
+            return (f.p1.x.value, f.p1.y.value, f.p2.x.value, f.p2.y.value)
+        return None
+
+    def add_candidate(self, key, pos, kind, fs):
+        self.candidates.insert(key, (pos[0], pos[1], pos[0], pos[1]))
+        self.candidate_info[key] = (np.array(pos, dtype=float), kind, fs)
+
+    def remove_candidate(self, key):
+        self.candidates.remove(key)
+        self.candidate_info.pop(key, None)
+
+    def add_feature(self, f, geometry):
+        self.geometry[f] = geometry
+        if isinstance(f, features.Point):
+            self.add_candidate(f, geometry, "endpoint", (f,))
+            self.count += 1
+            self.numbers[f] = self.count
+            bisect.insort(self.xs, (geometry[0], self.count, f))
+            bisect.insort(self.ys, (geometry[1], self.count, f))
+        elif isinstance(f, features.Line):
+            (x1, y1, x2, y2) = geometry
+            self.add_candidate(f, ((x1 + x2) / 2, (y1 + y2) / 2), "midpoint", (f,))
+            bounds = (min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+            for other in self.lines.query(bounds):
+                pos = intersection(f, other)
+                if pos is not None:
+                    key = frozenset((f, other))
+                    self.add_candidate(key, pos, "intersection", (f, other))
+                    self.intersections.setdefault(f, set()).add(key)
+                    self.intersections.setdefault(other, set()).add(key)
+            self.lines.insert(f, bounds)
+
+    def remove_feature(self, f):
+        geometry = self.geometry.pop(f)
+        self.remove_candidate(f)
+        if f in self.numbers:
+            n = self.numbers.pop(f)
+            for (coords, c) in ((self.xs, geometry[0]), (self.ys, geometry[1])):
+                del coords[bisect.bisect_left(coords, (c, n))]
+        self.lines.remove(f)
+        for key in self.intersections.pop(f, ()):
+            self.remove_candidate(key)
+            for other in key:
+                if other is not f:
+                    self.intersections.get(other, set()).discard(key)
+
+    def sync(self):
+        if not self.stale:
+            return
+        current = {}
+        for f in self.scene.features:
+            geometry = self.feature_geometry(f)
+            if geometry is not None:
+                current[f] = geometry
+        for f in list(self.geometry):
+            if current.get(f) != self.geometry[f]:
+                self.remove_feature(f)
+        for (f, geometry) in current.items():
+            if f not in self.geometry:
+                self.add_feature(f, geometry)
+        self.stale = False
+
+    def nearest_aligned(self, coords, value, radius, extra):
+        # The point whose coordinate is closest to value, within radius.
+        # coords is sorted (coordinate, number, point); extra is a short list
+        # of the same for points that are not in the scene yet.
+        best = None
+        i = bisect.bisect_left(coords, (value - radius,))
+        while i < len(coords) and coords[i][0] <= value + radius:
+            (c, _, f) = coords[i]
+            if best is None or abs(c - value) < abs(best[0] - value):
+                best = (c, f)
+            i += 1
+        for (c, _, f) in extra:
+            if abs(c - value) <= radius and (best is None or abs(c - value) < abs(best[0] - value)):
+                best = (c, f)
+        return best
+
+    def snap(self, pos, radius, exclude=(), extra=()):
+        # The best snap for a cursor at pos (scene coordinates),
+        # considering candidates within radius (scene units).
+        # Candidates from features in exclude are skipped, and points in
+        # extra (e.g. ones being created) are also considered for alignment.
+        self.sync()
+        pos = np.array(pos, dtype=float)
+
+        best = None
+        best_distance = radius
+        for key in self.candidates.query((pos[0] - radius, pos[1] - radius, pos[0] + radius, pos[1] + radius)):
+            (candidate, kind, fs) = self.candidate_info[key]
+            if any(f in exclude for f in fs):
+                continue
+            distance = np.linalg.norm(candidate - pos)
+            if distance <= best_distance:
+                (best, best_distance) = ((candidate, kind, fs), distance)
+        if best is not None:
+            return Snap(best[0], best[1], best[2])
+
+        aligned = []
+        snapped = pos.copy()
+        vertical = self.nearest_aligned(self.xs, pos[0], radius, [(p.x.value, 0, p) for p in extra])
+        if vertical is not None:
+            snapped[0] = vertical[0]
+            aligned.append((constraints.Vertical, vertical[1]))
+        horizontal = self.nearest_aligned(self.ys, pos[1], radius, [(p.y.value, 0, p) for p in extra])
+        if horizontal is not None:
+            snapped[1] = horizontal[0]
+            aligned.append((constraints.Horizontal, horizontal[1]))
+        return Snap(snapped, aligned=aligned)
@@ -3,6 +3,19 @@ import numpy as np
 EPSILON = 1e-10
 MAX_ITER = 500
 
+# Continuation substeps are solved to this fraction of the initial residual.
+# A substep is retried at half the size if it needs more iterations, or if
+# any Newton step fails to shrink by the contraction factor, since that
+# means the substep left the neighbourhood of the solution path.
+CONTINUATION_TOLERANCE = 1e-3
+CONTINUATION_MAX_ITER = 8
+CONTINUATION_CONTRACTION = 0.3
+CONTINUATION_MIN_STEP = 1. / 1024
+
+# A Cholesky factor whose smallest diagonal entry is below this fraction of its
+# largest is treated as rank deficient, and the step falls back to the SVD
+RANK_TOLERANCE = 1e-7
+
 class SolverException(Exception):
     pass
 
@@ -30,56 +43,314 @@ def remove_duplicates(l):
     seen_add = seen.add
     return [x for x in l if not (x in seen or seen_add(x))]
 
-def solve(eqs):
-    # Convert the given equations into a mapping of variables to equations
-    variables_to_eqs = {}
+def cholesky_solve(L, b):
+    # Solve L L^T z = b, given the lower triangular Cholesky factor L,
+    # by forward and back substitution. Each row is one vectorized dot
+    # product, which is far cheaper than a general solve of either factor.
+    n = len(b)
+    y = np.empty(n)
+    for i in range(n):
+        y[i] = (b[i] - np.dot(L[i, :i], y[:i])) / L[i, i]
+    U = np.ascontiguousarray(L.T)
+    z = np.empty(n)
+    for i in range(n - 1, -1, -1):
+        z[i] = (y[i] - np.dot(U[i, i + 1:], z[i + 1:])) / U[i, i]
+    return z
 
-    for e in eqs:
-        for v in e.variables:
-            if v in variables_to_eqs:
-                variables_to_eqs[v].add(e)
-            else:
-                variables_to_eqs[v] = {e}
+class Aliases:
+    # Union-find over variables that have been declared equal
 
-    # Perform depth-first search to find connected components
+    def __init__(self):
+        self.parent = {}
 
-    eqs_unseen = eqs[:]
+    def find(self, v):
+        root = v
+        while self.parent.get(root, root) is not root:
+            root = self.parent[root]
+        # Path compression
+        while v is not root:
+            (self.parent[v], v) = (root, self.parent.get(v, v))
+        return root
 
-    def search(eq):
-        if eq not in eqs_unseen:
-            return
-        eqs_unseen.remove(eq)
-        eqs_in_component.append(eq)
-        connected = remove_duplicates([neq for var in eq.variables for neq in variables_to_eqs[var]])
-        for neq in connected:
-            search(neq)
+    def union(self, v1, v2):
+        r1 = self.find(v1)
+        r2 = self.find(v2)
+        if r1 is not r2:
+            self.parent[r2] = r1
+        self.parent.setdefault(r1, r1)
 
-    # Enumerate all components
+    def groups(self):
+        groups = {}
+        for v in self.parent:
+            groups.setdefault(self.find(v), []).append(v)
+        return groups
 
-    components = []
+class Component:
+    # A connected set of equations that is solved independently.
+    # The symbolic structure (which variables and unknowns are involved,
+    # and how they map onto each other) is computed once, so the component
+    # can be solved repeatedly as values change.
 
-    while len(eqs_unseen) > 0:
-        eqs_in_component = []
-        search(eqs_unseen[0])
-        components.append(eqs_in_component)
+    def __init__(self, eqs, aliases, groups, fixed):
+        self.eqs = eqs
+        self.groups = groups
 
-    # Solve each component independently
-    for component in components:
-        # Get a list of variables
-        variables_list = remove_duplicates([v for eq in component for v in eq.variables])
+        # Get a list of variables, and the list of unknowns they alias to.
+        # Fixed values are appended after the unknowns as constants.
+        variables_list = remove_duplicates([v for eq in eqs for v in eq.variables])
+        roots_list = remove_duplicates([aliases.find(v) for v in variables_list])
+        self.unknowns = [v for v in roots_list if v not in fixed]
+        self.constants = [v for v in roots_list if v in fixed]
 
         variables_dict = {v: i for i, v in enumerate(variables_list)}
-        x = np.array([v.value for v in variables_list])
-        f = lambda x: np.hstack([e.f(variables_dict)(x) for e in component])
-        df = lambda x: np.vstack([e.df(variables_dict)(x) for e in component])
-        for i in range(MAX_ITER):
-            f_x = f(x)
-            if np.all(np.abs(f_x) <= EPSILON):
+        roots_dict = {v: i for i, v in enumerate(self.unknowns + self.constants)}
+
+        # Maps unknowns onto variables: x_variables = x_roots[root_index]
+        self.root_index = np.array([roots_dict[aliases.find(v)] for v in variables_list], dtype=int)
+
+        # The Jacobian column of an unknown is the sum of the columns of the
+        # variables aliased to it. Variables of unknowns are sorted by root,
+        # so each unknown's columns form a run starting at unknown_starts.
+        order = np.argsort(self.root_index, kind="stable")
+        self.unknown_columns = order[self.root_index[order] < len(self.unknowns)]
+        self.unknown_starts = np.searchsorted(self.root_index[self.unknown_columns], np.arange(len(self.unknowns)))
+
+        self.fs = [e.f(variables_dict) for e in eqs]
+        self.dfs = [e.df(variables_dict) for e in eqs]
+
+        # Whether the Jacobian has full rank: None until the first step.
+        # Once a step finds it rank deficient, later steps go straight to
+        # the SVD, until the component is rebuilt.
+        self.full_rank = None
+
+        # Statistics of the last solve, for diagnostics: the Newton iterations
+        # it took, and the largest residual of each equation when it finished.
+        # Both are None if the last solve of the system never reached this component.
+        self.iterations = None
+        self.residuals = None
+
+    def f(self, x, constants):
+        x = np.hstack((x, constants))[self.root_index]
+        return np.hstack([f_e(x) for f_e in self.fs])
+
+    def df(self, x, constants):
+        x = np.hstack((x, constants))[self.root_index]
+        J = np.vstack([df_e(x) for df_e in self.dfs])
+        return np.add.reduceat(J[:, self.unknown_columns], self.unknown_starts, axis=1)
+
+    def record(self, x, constants):
+        x = np.hstack((x, constants))[self.root_index]
+        self.residuals = np.array([np.max(np.abs(f_e(x)), initial=0.) for f_e in self.fs])
+
+    def min_norm_solve(self, A, b):
+        # The minimum-norm least-squares solution z of A z = b.
+        # With full rank this is a Cholesky factorization of the smaller of
+        # the normal equations A^T A (more rows) or A A^T (more columns),
+        # which is much cheaper than the SVD that pinv needs.
+        if self.full_rank is not False and A.size > 0:
+            (m, n) = A.shape
+            normal = np.dot(A.T, A) if m >= n else np.dot(A, A.T)
+            try:
+                L = np.linalg.cholesky(normal)
+                diagonal = np.abs(np.diag(L))
+                self.full_rank = bool(np.min(diagonal) > RANK_TOLERANCE * np.max(diagonal))
+            except np.linalg.LinAlgError:
+                self.full_rank = False
+            if self.full_rank:
+                rhs = np.dot(A.T, b) if m >= n else b
+                y = cholesky_solve(L, rhs)
+                return y if m >= n else np.dot(A.T, y)
+        return np.dot(np.linalg.pinv(A), b)
+
+    def newton(self, x, constants, offset, tolerance, max_iter, x0=None, d=None, contraction=None):
+        # Iterate on f(x) = offset, returning (x, iterations, converged).
+        # If d (W^(-1/2) per unknown) is given, steps are weighted least-norm
+        # steps anchored at x0. If contraction is given, give up as soon as
+        # a step is not at least that much shorter than the one before.
+        x = x.copy()
+        last_step = np.inf
+        for i in range(max_iter):
+            f_x = self.f(x, constants) - offset
+            if np.all(np.abs(f_x) <= tolerance):
+                return (x, i, True)
+            if len(self.unknowns) == 0:
                 break
-            dx = np.dot(np.linalg.pinv(df(x)), -f_x)
+            if d is None:
+                dx = self.min_norm_solve(self.df(x, constants), -f_x)
+            else:
+                # Weighted least-norm step:
+                # minimize |W^(1/2) (x + dx - x0)| subject to J dx = -f
+                J = self.df(x, constants)
+                y = d * self.min_norm_solve(J * d, np.dot(J, x - x0) - f_x)
+                dx = y - (x - x0)
+            step = np.linalg.norm(dx)
+            if contraction is not None and step > contraction * last_step:
+                return (x, i + 1, False)
+            last_step = step
             x += dx
-        else:
+        return (x, max_iter, False)
+
+    def continuation(self, x, constants, start, x0=None, d=None):
+        # Follow the solutions of f(x; c(t)) = (1 - t) f(x_start; start)
+        # from t = 0, where the current state is a solution, to t = 1.
+        # Fixed values c(t) move in a straight line from where they were
+        # to their targets, and any remaining residual is scaled down.
+        # Substeps are warm-started from the previous one and solved loosely;
+        # their size adapts so each converges quickly, which keeps the
+        # solution on the same branch (e.g. no sudden elbow flips).
+        # Returns (x, iterations, converged).
+        r0 = self.f(x, start)
+        tolerance = max(EPSILON, CONTINUATION_TOLERANCE * max(np.max(np.abs(r0), initial=0.), np.max(np.abs(self.f(x, constants)))))
+        iterations = 0
+        (t, dt) = (0., 1.)
+        while t < 1:
+            t_next = min(1., t + dt)
+            constants_t = start + t_next * (constants - start)
+            (x_next, i, converged) = self.newton(x, constants_t, (1 - t_next) * r0, tolerance, CONTINUATION_MAX_ITER, x0, d, CONTINUATION_CONTRACTION)
+            iterations += i
+            if converged:
+                (x, t) = (x_next, t_next)
+                if i <= CONTINUATION_MAX_ITER // 2:
+                    dt *= 2
+            else:
+                dt /= 2
+                if dt < CONTINUATION_MIN_STEP:
+                    return (x, iterations, False)
+        return (x, iterations, True)
+
+    def solve(self, fixed, weights=None, continuation=False, start=None):
+        # start holds the values fixed variables had before the solve,
+        # from which continuation moves them to their fixed values
+        constants = np.array([fixed[v] for v in self.constants])
+        x = np.array([v.value for v in self.unknowns])
+        x0 = x.copy()
+        d = None
+        if weights is not None:
+            # Scale by W^(-1/2); an aliased unknown takes its heaviest member's weight
+            d = np.array([1. / np.sqrt(max(weights.get(m, 1.) for m in self.groups.get(v, (v,)))) for v in self.unknowns])
+
+        start = constants if start is None else np.array([start[v] for v in self.constants])
+
+        # Try the requested method first, and the other if it fails
+        self.iterations = 0
+        for use_continuation in ((True, False) if continuation else (False, True)):
+            x = x0
+            if use_continuation:
+                (x, i, converged) = self.continuation(x, constants, start, x0, d)
+                self.iterations += i
+                if not converged:
+                    continue
+            (x, i, converged) = self.newton(x, constants, 0., EPSILON, MAX_ITER, x0, d)
+            self.iterations += i
+            if converged:
+                break
+        self.record(x, constants)
+        if not converged:
             raise SolverException("Did not converge.")
 
-        for (xv, v) in zip(x, variables_list):
-            v.value = xv
+        for (xv, v) in zip(x, self.unknowns):
+            for member in self.groups.get(v, (v,)):
+                member.value = xv
+
+class System:
+    # The analysis of a set of equations: aliasing, fixed variables and
+    # connected components. Build it once and call solve() as often as
+    # values change; rebuild it when the set of equations changes.
+
+    def __init__(self, eqs):
+        # Equalities (e.g. Coincident, Horizontal) are merged by aliasing,
+        # and fixed values are substituted into every variable they reach
+        # through those equalities. Only the remaining equations need to go
+        # through the iterative solver.
+        self.aliases = Aliases()
+        for e in eqs:
+            for (v1, v2) in getattr(e, "aliases", ()):
+                self.aliases.union(v1, v2)
+        self.groups = self.aliases.groups()
+
+        self.fixing = [e for e in eqs if getattr(e, "fixes", ())]
+        fixed = {self.aliases.find(v) for e in self.fixing for (v, val) in e.fixes}
+
+        eqs = [e for e in eqs if not getattr(e, "aliases", ()) and not getattr(e, "fixes", ())]
+
+        # Convert the remaining equations into a mapping of variables to equations
+        variables_to_eqs = {}
+
+        for e in eqs:
+            for v in e.variables:
+                v = self.aliases.find(v)
+                if v in fixed:
+                    continue
+                if v in variables_to_eqs:
+                    variables_to_eqs[v].append(e)
+                else:
+                    variables_to_eqs[v] = [e]
+
+        # Enumerate all connected components using an iterative depth-first search
+
+        self.components = []
+        eqs_seen = set()
+
+        for eq in eqs:
+            if eq in eqs_seen:
+                continue
+            eqs_seen.add(eq)
+            eqs_in_component = []
+            stack = [eq]
+            while len(stack) > 0:
+                eq = stack.pop()
+                eqs_in_component.append(eq)
+                for var in eq.variables:
+                    for neq in variables_to_eqs.get(self.aliases.find(var), ()):
+                        if neq not in eqs_seen:
+                            eqs_seen.add(neq)
+                            stack.append(neq)
+            self.components.append(Component(eqs_in_component, self.aliases, self.groups, fixed))
+
+    def presolve(self, weights=None):
+        # Set every aliased group and fixed variable to its value,
+        # and return the fixed values by group, along with the values
+        # those groups had before
+        if weights is None:
+            weights = {}
+
+        # Start each group from the (weighted) mean of its members
+        for (root, members) in self.groups.items():
+            w = [weights.get(v, 1.) for v in members]
+            value = sum(wv * v.value for (wv, v) in zip(w, members)) / sum(w)
+            for v in members:
+                v.value = value
+
+        fixed = {}
+        for e in self.fixing:
+            for (v, val) in e.fixes:
+                root = self.aliases.find(v)
+                if root in fixed and abs(fixed[root] - val) > EPSILON:
+                    raise SolverException("Conflicting fixed values.")
+                fixed[root] = val
+
+        start = {root: root.value for root in fixed}
+        for (root, val) in fixed.items():
+            for v in self.groups.get(root, (root,)):
+                v.value = val
+
+        return (fixed, start)
+
+    def solve(self, weights=None, continuation=False):
+        # If weights (a mapping of variables to positive numbers) are given,
+        # each step minimizes the weighted displacement from the pre-solve state,
+        # so heavily weighted variables (e.g. ones being dragged) stay put
+        # and unaffected geometry does not drift.
+        # Otherwise each step is the minimum-norm Newton step.
+        # With continuation, each component moves to its solution in
+        # adaptive substeps, for large changes in values or dimensions.
+        # Either way, a component that fails to converge is retried
+        # with the other method before giving up.
+        for component in self.components:
+            (component.iterations, component.residuals) = (None, None)
+        (fixed, start) = self.presolve(weights)
+        for component in self.components:
+            component.solve(fixed, weights, continuation, start)
+
+def solve(eqs, weights=None, continuation=False):
+    System(eqs).solve(weights, continuation)
@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+import features
+import constraints
+import solver
+
+STEP = 1e-6
+TOLERANCE = 1e-5
+
+def line(x1, y1, x2, y2):
+    return features.Line(features.Point(x1, y1), features.Point(x2, y2))
+
+def circle(x, y, r):
+    return features.Circle(features.Point(x, y), features.Scalar(r))
+
+def arc(x, y, r):
+    # A quarter arc, counterclockwise from angle 0
+    return features.Arc(features.Point(x, y), features.Scalar(r), features.Point(x + r, y), features.Point(x, y + r))
+
+# One instance of every constraint that is solved through f and df
+CASES = {
+    "FixedDistance": lambda: constraints.FixedDistance(features.Point(0, 1), features.Point(2, 3), 4),
+    "Distance": lambda: constraints.Distance(features.Point(0, 1), features.Point(2, 3), features.Scalar(4).var),
+    "FixedX": lambda: constraints.FixedX(features.Point(0, 1), 2),
+    "FixedY": lambda: constraints.FixedY(features.Point(0, 1), 2),
+    "Vertical": lambda: constraints.Vertical(line(0, 1, 2, 3)),
+    "Horizontal": lambda: constraints.Horizontal(features.Point(0, 1), features.Point(2, 3)),
+    "CongruentLines": lambda: constraints.CongruentLines(line(0, 1, 2, 3), line(4, 5, 6, 7)),
+    "Parallel": lambda: constraints.Parallel(line(0, 1, 2, 3), line(4, 5, 6, 7)),
+    "Perpendicular": lambda: constraints.Perpendicular(line(0, 1, 2, 3), line(4, 5, 6, 7)),
+    "PointOnLine": lambda: constraints.PointOnLine(features.Point(0, 1), line(2, 3, 4, 5)),
+    "Midpoint": lambda: constraints.Midpoint(line(2, 3, 4, 5), features.Point(0, 1)),
+    "PointOnCircle": lambda: constraints.PointOnCircle(features.Point(0, 1), circle(2, 3, 4)),
+    "Tangent": lambda: constraints.Tangent(line(0, 1, 2, 3), circle(4, 5, 6)),
+    "TangentArc": lambda: (lambda a: constraints.Tangent(a, features.Line(features.Point(7, 1), a.p1)))(arc(4, 5, 6)),
+}
+
+@pytest.mark.parametrize("name", sorted(CASES))
+def test_df_matches_finite_differences(name):
+    c = CASES[name]()
+    variables = {v: i for (i, v) in enumerate(c.variables)}
+    f = c.f(variables)
+    df = c.df(variables)
+
+    rng = np.random.default_rng(0)
+    for trial in range(10):
+        x = rng.uniform(-10, 10, len(variables))
+        numeric = np.array([np.atleast_1d(f(x + STEP * e) - f(x - STEP * e)) / (2 * STEP)
+                            for e in np.eye(len(variables))]).T
+        analytic = df(x)
+        assert analytic.shape == numeric.shape
+        scale = max(1., np.max(np.abs(numeric)))
+        assert np.max(np.abs(analytic - numeric)) / scale < TOLERANCE
+
+@pytest.mark.parametrize("name", sorted(CASES))
+def test_df_with_extra_variables(name):
+    # Rows must span every variable in the component, not just the constraint's own
+    c = CASES[name]()
+    extra = features.Point(0, 0)
+    variables = {v: i for (i, v) in enumerate((extra.x,) + c.variables + (extra.y,))}
+    x = np.arange(len(variables), dtype=float)
+    p = c.df(variables)(x)
+    assert p.shape == (len(np.atleast_1d(c.f(variables)(x))), len(variables))
+    assert np.all(p[:, 0] == 0) and np.all(p[:, -1] == 0)
+
+def test_compatible():
+    (p1, p2) = (features.Point(0, 0), features.Point(1, 1))
+    l1 = features.Line(p1, p2)
+    l2 = line(2, 2, 3, 3)
+    c = circle(0, 0, 1)
+
+    assert constraints.Coincident.compatible((p1, p2))
+    assert not constraints.Coincident.compatible((p1, l1))
+    assert constraints.Horizontal.compatible((l1,))
+    assert constraints.Horizontal.compatible((p1, p2))
+    assert constraints.Parallel.compatible((l1, l2))
+    assert not constraints.Parallel.compatible((l1, c))
+    assert constraints.Tangent.compatible((l1, c))
+    assert constraints.Tangent.compatible((c, l1))
+    assert constraints.PointOnCircle.compatible((c, p1))
+    assert constraints.Concentric.compatible((c, circle(1, 1, 1)))
+
+def test_arc_constraints():
+    a = arc(0, 0, 1)
+    assert constraints.PointOnCircle.compatible((a.p2, a))
+    assert constraints.Concentric.compatible((a, circle(1, 1, 1)))
+    # Tangency to an arc is where the line meets it
+    assert not constraints.Tangent.compatible((line(-1, 1, 1, 1), a))
+    assert constraints.Tangent.compatible((features.Line(a.p2, features.Point(-1, 1)), a))
+
+def test_line_tangent_to_arc():
+    # A line leaving the end of a quarter arc is made tangent to it there
+    a = arc(0, 0, 2)
+    q = features.Point(-1, 2.5)
+    l = features.Line(a.p2, q)
+    eqs = [
+        constraints.FixedX(a.center, 0), constraints.FixedY(a.center, 0),
+        constraints.PointOnCircle(a.p1, a), constraints.PointOnCircle(a.p2, a),
+        constraints.FixedX(a.p1, 2), constraints.FixedY(a.p1, 0),
+        constraints.FixedX(q, -1),
+        constraints.Tangent(l, a),
+    ]
+    solver.solve(eqs)
+    p = np.array([a.p2.x.value, a.p2.y.value])
+    assert np.isclose(np.linalg.norm(p), 2)
+    assert np.isclose(np.dot(p, np.array([q.x.value, q.y.value]) - p), 0)
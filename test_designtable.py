@@ -0,0 +1,59 @@
+import numpy as np
+import features
+import constraints
+import designtable
+import solver
+
+def rectangle():
+    (w, h) = (features.Parameter("w", 3), features.Parameter("h", 4))
+    (a, b, c) = (features.Point(0, 0), features.Point(3, 0.1), features.Point(3.1, 4))
+    eqs = [
+        constraints.FixedX(a, 0),
+        constraints.FixedY(a, 0),
+        constraints.Horizontal(a, b),
+        constraints.Vertical(b, c),
+        constraints.FixedDistance(a, b, w),
+        constraints.FixedDistance(b, c, h),
+    ]
+    return ((w, h), (a, b, c), eqs)
+
+def test_parameter_drives_constraint():
+    ((w, h), (a, b, c), eqs) = rectangle()
+    solver.solve(eqs)
+    assert np.isclose(b.x.value, 3)
+    w.var.value = 7
+    solver.solve(eqs)
+    assert np.isclose(b.x.value, 7)
+    assert w.var.value == 7
+
+def test_sweep():
+    ((w, h), (a, b, c), eqs) = rectangle()
+    table = np.random.default_rng(0).uniform(1, 10, (50, 2))
+    for processes in (1, 2):
+        results = designtable.sweep(eqs, (w, h), table, (b.x, c.y), processes=processes)
+        assert results.shape == (50, 2)
+        assert np.allclose(results, table)
+    # The sketch itself is left as it was
+    assert (b.x.value, w.var.value) == (3, 3)
+
+def test_sweep_failed_rows_are_nan():
+    ((w, h), (a, b, c), eqs) = rectangle()
+    eqs.append(constraints.FixedDistance(a, c, 5))
+    results = designtable.sweep(eqs, (w, h), [(3, 4), (1, 1)], (b.x,), processes=1)
+    assert np.allclose(results[0], 3)
+    assert np.isnan(results[1, 0])
+
+def test_sweep_scene():
+    # Constraints in a scene refer to it, and it holds unpicklable state
+    # (solver closures and selection listeners), none of which reaches the workers
+    from app import Scene
+    ((w, h), (a, b, c), eqs) = rectangle()
+    scene = Scene()
+    for f in (a, b, c):
+        scene.add_feature(f)
+    for e in eqs:
+        scene.add_constraint(e)
+    scene.system().solve()
+    scene.selection.connect(lambda added, removed: None)
+    results = designtable.sweep(scene.constraints, (w, h), [(3, 4), (5, 6)], (b.x, c.y), processes=2)
+    assert np.allclose(results, [(3, 4), (5, 6)])
@@ -0,0 +1,63 @@
+import io
+import features
+import constraints
+import solver
+import diagnostics
+
+def sketch():
+    # A fixed, dimensioned triangle, and a separate single distance
+    (p1, p2, p3) = (features.Point(0, 0), features.Point(3, 0.2), features.Point(0.1, 4))
+    (l1, l2) = (features.Line(p1, p2), features.Line(p1, p3))
+    (q1, q2) = (features.Point(10, 10), features.Point(12, 10))
+    eqs = [
+        constraints.FixedX(p1, 0),
+        constraints.FixedY(p1, 0),
+        constraints.Perpendicular(l1, l2),
+        constraints.Horizontal(l1),
+        constraints.FixedDistance(p1, p2, 3),
+        constraints.FixedDistance(p1, p3, 4),
+        constraints.FixedDistance(q1, q2, 5),
+    ]
+    return (eqs, l1, q1)
+
+def test_stats_from_last_solve():
+    (eqs, l1, q1) = sketch()
+    system = solver.System(eqs)
+    assert diagnostics.constraint_stats(system) == {}
+
+    system.solve()
+    stats = diagnostics.constraint_stats(system)
+    # Fixed values and Horizontal are presolved, so they have no statistics
+    assert set(stats) == set(eqs[2:3] + eqs[4:])
+    (size, iterations, residual) = stats[eqs[2]]
+    assert (size, residual <= solver.EPSILON) == (3, True)
+    assert iterations >= 1
+    assert stats[eqs[6]][0] == 4
+
+    assert diagnostics.feature_values(system, "size")[q1] == 4
+    assert diagnostics.feature_values(system, "iterations")[l1] == iterations
+
+def test_stats_of_failed_solve():
+    (p1, p2) = (features.Point(0, 0), features.Point(1, 0))
+    eqs = [constraints.FixedDistance(p1, p2, 1), constraints.FixedDistance(p1, p2, 2)]
+    system = solver.System(eqs)
+    try:
+        system.solve()
+    except solver.SolverException:
+        pass
+    stats = diagnostics.constraint_stats(system)
+    assert max(residual for (size, iterations, residual) in stats.values()) > 0.1
+    assert diagnostics.fractions(diagnostics.feature_values(system, "residual"), "residual")[p1] == 1.
+
+def test_graph():
+    (eqs, l1, q1) = sketch()
+    system = solver.System(eqs)
+    system.solve()
+    out = io.StringIO()
+    diagnostics.write_graph(system, out)
+    dot = out.getvalue()
+    assert dot.count("subgraph cluster_") == 2
+    assert dot.count("shape=box") == 4
+    assert dot.count("shape=ellipse") == 7
+    # p1 and (through Horizontal) p2.y are fixed, so they are not part of the graph
+    assert dot.count(" -- ") == 3 + 1 + 2 + 4
@@ -0,0 +1,66 @@
+import io
+import numpy as np
+import pytest
+import features
+import export
+
+def sketch():
+    (p1, p2, p3) = (features.Point(0, 0), features.Point(10, 0), features.Point(10, 5))
+    c = features.Point(3, 3)
+    return [p1, p2, p3, c,
+            features.Line(p1, p2), features.Line(p2, p3),
+            features.Circle(c, features.Scalar(2)),
+            features.Arc(c, features.Scalar(4), features.Point(7, 3), features.Point(3, 7))]
+
+def test_geometry_is_streamed():
+    g = export.geometry(sketch())
+    assert next(g) == ("line", 0, 0, 10, 0)
+    assert [kind for (kind, *rest) in g] == ["line", "circle", "arc"]
+
+def test_bounds():
+    # Arcs are bounded by their whole circle
+    assert export.bounds(sketch()) == (-1, -1, 10, 7)
+    assert export.bounds([]) == (0, 0, 0, 0)
+
+def test_svg():
+    out = io.StringIO()
+    export.write_svg(sketch(), out)
+    svg = out.getvalue()
+    assert svg.count("<line ") == 2
+    assert svg.count("<circle ") == 1
+    assert svg.count("<path ") == 1
+    assert svg.rstrip().endswith("</svg>")
+
+def test_dxf():
+    out = io.StringIO()
+    export.write_dxf(sketch(), out)
+    lines = out.getvalue().split("\n")
+    assert lines.count("LINE") == 2
+    assert lines.count("CIRCLE") == 1
+    assert lines.count("ARC") == 1
+    # y is flipped, so the arc from 0 to 90 degrees (y down) runs from 270 to 360 (y up)
+    i = lines.index("ARC")
+    assert (float(lines[i + 12]), float(lines[i + 14])) == (270, 0)
+    assert lines[-3:] == ["0", "EOF", ""]
+
+def test_command_line(tmp_path):
+    script = tmp_path / "sketch.py"
+    script.write_text(
+        "import features, constraints\n"
+        "class Scene:\n"
+        "    pass\n"
+        "scene = Scene()\n"
+        "(a, b) = (features.Point(0, 0), features.Point(3, 1))\n"
+        "scene.features = [a, b, features.Line(a, b)]\n"
+        "scene.constraints = [constraints.Horizontal(a, b)]\n")
+    output = tmp_path / "out.dxf"
+    assert export.main(["export.py", str(script), str(output)]) == 0
+    assert "LINE" in output.read_text().split("\n")
+
+def test_format_from_extension(tmp_path):
+    directory = tmp_path / "my.dir"
+    directory.mkdir()
+    export.export(sketch(), str(directory / "drawing.DXF"))
+    assert "ENTITIES" in (directory / "drawing.DXF").read_text()
+    with pytest.raises(ValueError):
+        export.export(sketch(), str(directory / "drawing"))
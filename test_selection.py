@@ -0,0 +1,78 @@
+import features
+import constraints
+import render
+from app import Scene
+
+def sketch():
+    # Two separate lines, one of them constrained, and a lone point
+    scene = Scene()
+    (p1, p2, p3, p4, p5) = (features.Point(0, 0), features.Point(1, 0), features.Point(2, 0), features.Point(3, 0), features.Point(9, 9))
+    (l1, l2) = (features.Line(p1, p2), features.Line(p3, p4))
+    for f in (p1, p2, p3, p4, p5, l1, l2):
+        scene.add_feature(f)
+    c = constraints.Horizontal(l1)
+    scene.add_constraint(c)
+    return (scene, (p1, p2, p3, p4, p5), (l1, l2), c)
+
+def test_notifications():
+    (scene, (p1, p2, p3, p4, p5), (l1, l2), c) = sketch()
+    changes = []
+    scene.selection.connect(lambda added, removed: changes.append((added, removed)))
+
+    scene.selection.add(p1, p2)
+    assert p1.selected and not p3.selected
+    scene.selection.add(p1)
+    scene.selection.toggle(p3)
+    scene.selection.replace([p3, l1])
+    assert list(scene.selection) == [p3, l1]
+    scene.selection.clear()
+    assert changes == [([p1, p2], []), ([p3], []), ([l1], [p1, p2]), ([], [p3, l1])]
+
+def test_bulk_operations():
+    (scene, (p1, p2, p3, p4, p5), (l1, l2), c) = sketch()
+    scene.selection.select_all()
+    assert len(scene.selection) == len(scene.features)
+
+    scene.selection.discard(p1, l2)
+    scene.selection.invert()
+    assert list(scene.selection) == [p1, l2]
+
+    scene.selection.select_type(features.Line)
+    assert set(scene.selection) == {l1, l2}
+
+    # The first line's component reaches its endpoints, through the line and its constraint
+    scene.selection.replace([p1])
+    scene.selection.select_connected()
+    assert set(scene.selection) == {p1, p2, l1}
+
+def test_delete_deselects():
+    (scene, (p1, p2, p3, p4, p5), (l1, l2), c) = sketch()
+    scene.selection.add(p1, l1, p5)
+    scene.constraint_selection.add(c)
+    for f in scene.selection:
+        f.delete()
+    assert len(scene.selection) == 0
+    assert len(scene.constraint_selection) == 0
+    assert not p1.selected
+
+def test_render_cache_follows_selection():
+    (scene, (p1, p2, p3, p4, p5), (l1, l2), c) = sketch()
+    cache = render.RenderCache(scene)
+    scene.selection.connect(lambda added, removed: (cache.set_selected(removed, False), cache.set_selected(added, True)))
+    scene.selection.add(p2, l2)
+    scene.selection.replace([l2])
+    assert list(cache.points_selected) == [False] * 5
+    assert list(cache.segments_selected) == [False, True]
+    assert list(render.RenderCache(scene).segments_selected) == [False, True]
+
+def test_deleting_circle_removes_its_radius():
+    scene = Scene()
+    center = features.Point(0, 0)
+    radius = features.Scalar(2)
+    circle = features.Circle(center, radius)
+    for f in (center, radius, circle):
+        scene.add_feature(f)
+    scene.selection.add(circle, radius)
+    circle.delete()
+    assert scene.features == [center]
+    assert len(scene.selection) == 0
@@ -0,0 +1,154 @@
+import io
+import os
+import numpy as np
+import pytest
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+from PyQt5 import QtWidgets
+from PyQt5.QtCore import Qt
+import featurecreator
+import session
+from app import Document
+from workspace import Workspace
+
+@pytest.fixture(scope="module")
+def workspace():
+    application = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    workspace = Workspace()
+    yield workspace
+    workspace.shutdown()
+
+def state(document):
+    return [(type(f).__name__, f.x.value, f.y.value) if hasattr(f, "x") else (type(f).__name__,) for f in document.scene.features]
+
+def interact(canvas):
+    # Draw a line, drag its end at a different zoom, then split it.
+    # Like a replay, wait for the solver after every event.
+    def event(handler, *args):
+        handler(*args)
+        canvas.finish()
+
+    event(canvas.start_create, featurecreator.LineCreator)
+    event(canvas.press, np.array([0., 0.]), Qt.NoModifier)
+    event(canvas.move, np.array([50., 3.]))
+    event(canvas.press, np.array([100., 4.]), Qt.NoModifier)
+    event(canvas.key, Qt.Key_Escape)
+
+    canvas.scale = 2.
+    (p1, p2, line) = canvas.scene.features
+    event(canvas.press, np.array([p2.x.value, p2.y.value]), Qt.NoModifier)
+    for t in np.linspace(0, 1, 5):
+        event(canvas.move, np.array([p2.x.value, p2.y.value]) + t * np.array([20., 30.]))
+    event(canvas.release, np.array([p2.x.value, p2.y.value]))
+
+    midpoint = np.array([(p1.x.value + p2.x.value) / 2, (p1.y.value + p2.y.value) / 2])
+    event(canvas.press, midpoint, Qt.NoModifier)
+    event(canvas.release, midpoint)
+    event(canvas.choose, midpoint, "split")
+
+def test_record_and_replay(workspace):
+    recorded = Document(workspace)
+    out = io.StringIO()
+    recorded.canvas.recorder = session.Recorder(out)
+    interact(recorded.canvas)
+    assert len(recorded.scene.features) == 5
+
+    events = list(session.read(io.StringIO(out.getvalue())))
+    assert [kind for (kind, args) in events].count("view") == 2
+    assert ("menu", (events[-1][1][0], events[-1][1][1], "split")) == events[-1]
+
+    replayed = Document(workspace)
+    latencies = session.replay(replayed.canvas, events, featurecreator.available)
+    assert len(latencies) == len(events)
+    assert all(t >= 0 for (kind, args, t) in latencies)
+    assert state(replayed) == state(recorded)
+
+    report = io.StringIO()
+    session.report(latencies, out=report)
+    assert "slowest events" in report.getvalue()
+
+    recorded.release()
+    replayed.release()
+
+def test_read_rejects_other_files():
+    with pytest.raises(ValueError):
+        list(session.read(io.StringIO("<svg/>\n")))
+
+def test_canvas_solves_in_background(workspace):
+    # With an event loop, the finished solve is delivered back by a signal
+    import time
+    import features
+    import constraints
+    document = Document(workspace)
+    (p1, p2) = (features.Point(0, 0), features.Point(50, 10))
+    for f in (p1, p2, features.Line(p1, p2)):
+        document.scene.add_feature(f)
+    document.scene.add_constraint(constraints.Horizontal(p1, p2))
+    document.update_fn()
+    document.canvas.refresh()
+    assert document.canvas.solving is not None
+    deadline = time.time() + 10
+    while document.canvas.solving is not None and time.time() < deadline:
+        QtWidgets.QApplication.processEvents()
+    assert document.canvas.solving is None
+    assert p1.y.value == p2.y.value
+    document.canvas.refresh()
+    assert document.canvas.render_cache is not None
+    document.release()
+
+def test_drag_rebuilds_lists_once(workspace):
+    # Drag moves only re-solve the canvas; the lists are rebuilt on release
+    import features
+    document = Document(workspace)
+    (p1, p2) = (features.Point(0, 0), features.Point(50, 10))
+    for f in (p1, p2, features.Line(p1, p2)):
+        document.scene.add_feature(f)
+    document.update_fn()
+    rebuilds = []
+    update = document.feature_list.update
+    document.feature_list.update = lambda: (rebuilds.append(None), update())
+    canvas = document.canvas
+    canvas.press(np.array([50., 10.]), Qt.NoModifier)
+    for x in (55., 60., 65.):
+        canvas.move(np.array([x, 10.]))
+        canvas.finish()
+    assert rebuilds == []
+    assert p2.x.value == 65.
+    canvas.release(np.array([65., 10.]))
+    assert len(rebuilds) == 1
+    assert document.feature_list.items[p2].text() == str(p2)
+    document.release()
+
+def test_arc_joins_line(workspace):
+    # An arc started on the end of a line shares its point, and can be made tangent to it
+    import features
+    import constraints
+    document = Document(workspace)
+    canvas = document.canvas
+    canvas.start_create(featurecreator.LineCreator)
+    canvas.press(np.array([0., 0.]), Qt.NoModifier)
+    canvas.press(np.array([100., 0.]), Qt.NoModifier)
+    canvas.key(Qt.Key_Escape)
+    canvas.start_create(featurecreator.ArcCreator)
+    for pos in ((100., 50.), (100., 0.), (150., 52.)):
+        canvas.press(np.array(pos), Qt.NoModifier)
+    canvas.key(Qt.Key_Escape)
+    canvas.finish()
+
+    (line,) = [f for f in document.scene.features if type(f) is features.Line]
+    (arc,) = [f for f in document.scene.features if type(f) is features.Arc]
+    assert arc.p1 is line.p2
+    assert np.hypot(arc.p2.x.value - 100, arc.p2.y.value - 50) == pytest.approx(50)
+    assert [type(c) for c in arc.constraints] == [constraints.PointOnCircle] * 2
+
+    canvas.scene.selection.replace([line, arc])
+    canvas.choose(np.array([0., 0.]), "Tangent")
+    canvas.finish()
+    assert canvas.line_color == Qt.blue
+    (p, q, c) = [np.array([f.x.value, f.y.value]) for f in (line.p2, line.p1, arc.center)]
+    assert np.dot(p - c, q - p) == pytest.approx(0, abs=1e-6)
+
+    # Deleting the arc takes its constraints with it, but not the line
+    arc.delete()
+    assert all(arc not in c.features for c in document.scene.constraints)
+    assert line in document.scene.features
+    document.release()
@@ -0,0 +1,95 @@
+import numpy as np
+import features
+import constraints
+import snap
+
+class Scene:
+    def __init__(self):
+        self.features = []
+
+def lines(scene, *coords):
+    result = []
+    for (x1, y1, x2, y2) in coords:
+        (p1, p2) = (features.Point(x1, y1), features.Point(x2, y2))
+        l = features.Line(p1, p2)
+        scene.features += [p1, p2, l]
+        result.append(l)
+    return result
+
+def test_grid_index():
+    index = snap.GridIndex(10)
+    index.insert("a", (0, 0, 5, 5))
+    index.insert("b", (100, 100, 120, 105))
+    assert index.query((1, 1, 2, 2)) == {"a"}
+    assert index.query((110, 90, 130, 100)) == {"b"}
+    index.remove("a")
+    assert index.query((1, 1, 2, 2)) == set()
+    assert index.query((-1000, -1000, 1000, 1000)) == {"b"}
+
+def test_snap_kinds():
+    scene = Scene()
+    (l1, l2) = lines(scene, (0, 0, 100, 0), (60, -50, 60, 30))
+    snapper = snap.Snapper(scene)
+
+    s = snapper.snap((1, 2), 5)
+    assert s.kind == "endpoint" and s.features == (l1.p1,)
+    s = snapper.snap((52, 1), 5)
+    assert s.kind == "midpoint" and s.features == (l1,)
+    s = snapper.snap((61, 1), 5)
+    assert s.kind == "intersection" and set(s.features) == {l1, l2}
+    assert np.allclose(s.pos, (60, 0))
+
+    s = snapper.snap((58, 200), 5)
+    assert s.kind is None
+    assert s.aligned[0][0] is constraints.Vertical and s.aligned[0][1] in (l2.p1, l2.p2)
+    assert np.allclose(s.pos, (60, 200))
+
+def test_snap_intersection_places_constraints():
+    scene = Scene()
+    (l1, l2) = lines(scene, (0, 0, 100, 10), (30, -50, 70, 50))
+    snapper = snap.Snapper(scene)
+    s = snapper.snap((52, 5), 2)
+    assert s.kind == "intersection"
+    (p, cs) = s.place()
+    assert sorted(type(c).__name__ for c in cs) == ["PointOnLine", "PointOnLine"]
+
+def test_snap_tracks_scene_changes():
+    scene = Scene()
+    (l1,) = lines(scene, (0, 0, 100, 0))
+    snapper = snap.Snapper(scene)
+    assert snapper.snap((100, 1), 5).kind == "endpoint"
+
+    (l1.p2.x.value, l1.p2.y.value) = (300, 300)
+    snapper.invalidate()
+    assert snapper.snap((100, 1), 5).kind is None
+    assert snapper.snap((150, 150), 5).kind == "midpoint"
+
+    (l2,) = lines(scene, (0, 300, 300, 0))
+    snapper.invalidate()
+    assert snapper.snap((150, 150), 5).kind in ("midpoint", "intersection")
+    scene.features.remove(l2)
+    scene.features.remove(l1)
+    snapper.invalidate()
+    assert snapper.snap((150, 150), 5).kind is None
+    assert len(snapper.intersections.get(l1, ())) == 0
+
+def test_zoomed_out_query_visits_occupied_cells():
+    # A query box of ~10^10 cells must not loop over them
+    index = snap.GridIndex(1)
+    index.insert("a", (0, 0, 1, 1))
+    index.insert("b", (3e4, -2e4, 3e4, -2e4))
+    index.insert("c", (9e5, 0, 9e5, 0))
+    assert index.query((-1e5, -1e5, 1e5, 1e5)) == {"a", "b"}
+
+def test_alignment_lists_follow_moves():
+    scene = Scene()
+    (l1, l2) = lines(scene, (0, 0, 100, 0), (10, 50, 20, 60))
+    snapper = snap.Snapper(scene)
+    snapper.sync()
+    (l2.p1.x.value, l2.p1.y.value) = (-40, 200)
+    scene.features.remove(l1.p2)
+    snapper.invalidate()
+    assert snapper.snap((-41, 30), 5).aligned == ((constraints.Vertical, l2.p1),)
+    points = [f for f in scene.features if isinstance(f, features.Point)]
+    assert [f for (c, n, f) in snapper.xs] == sorted(points, key=lambda f: f.x.value)
+    assert [f for (c, n, f) in snapper.ys] == sorted(points, key=lambda f: f.y.value)
@@ -0,0 +1,311 @@
+import time
+import tracemalloc
+import numpy as np
+import pytest
+import features
+import constraints
+import solver
+
+def residuals(eqs):
+    # Largest residual over all equations, evaluated at the current values
+    worst = 0.
+    for e in eqs:
+        if not hasattr(e, "f"):
+            continue
+        variables = {v: i for (i, v) in enumerate(e.variables)}
+        x = np.array([v.value for v in e.variables])
+        worst = max(worst, np.max(np.abs(e.f(variables)(x))))
+    return worst
+
+def polyline(*coords):
+    points = [features.Point(x, y) for (x, y) in coords]
+    lines = [features.Line(p1, p2) for (p1, p2) in zip(points, points[1:] + points[:1])]
+    return (points, lines)
+
+def rectangle(x, y, w, h):
+    # A fully constrained, slightly perturbed rectangle
+    (points, lines) = polyline((x, y), (x + w + 0.3, y + 0.2), (x + w - 0.1, y + h + 0.4), (x - 0.2, y + h - 0.3))
+    eqs = [
+        constraints.FixedX(points[0], x),
+        constraints.FixedY(points[0], y),
+        constraints.Horizontal(lines[0]),
+        constraints.Vertical(lines[1]),
+        constraints.Horizontal(lines[2]),
+        constraints.Vertical(lines[3]),
+        constraints.FixedDistance(points[0], points[1], w),
+        constraints.FixedDistance(points[1], points[2], h),
+    ]
+    return (points, eqs)
+
+def test_rectangle():
+    (points, eqs) = rectangle(1, 2, 3, 4)
+    solver.solve(eqs)
+    coords = np.array([(p.x.value, p.y.value) for p in points])
+    assert np.allclose(np.abs(coords - coords[0]), [(0, 0), (3, 0), (3, 4), (0, 4)])
+
+def test_rotated_rectangle():
+    (points, lines) = polyline((0, 0), (4, 1), (3, 4), (-1, 2))
+    eqs = [
+        constraints.FixedX(points[0], 0),
+        constraints.FixedY(points[0], 0),
+        constraints.Parallel(lines[0], lines[2]),
+        constraints.Parallel(lines[1], lines[3]),
+        constraints.Perpendicular(lines[0], lines[1]),
+        constraints.FixedDistance(points[0], points[1], 4),
+        constraints.FixedDistance(points[1], points[2], 3),
+    ]
+    solver.solve(eqs)
+    assert residuals(eqs) <= solver.EPSILON
+    assert np.isclose(np.hypot(points[2].x.value, points[2].y.value), 5)
+
+def test_four_bar_linkage():
+    (a, b, c, d) = (features.Point(0, 0), features.Point(1, 2), features.Point(4, 2.5), features.Point(5, 0))
+    eqs = [
+        constraints.FixedX(a, 0), constraints.FixedY(a, 0),
+        constraints.FixedX(d, 5), constraints.FixedY(d, 0),
+        constraints.FixedDistance(a, b, 2),
+        constraints.FixedDistance(b, c, 4),
+        constraints.FixedDistance(c, d, 3),
+    ]
+    solver.solve(eqs)
+    assert residuals(eqs) <= solver.EPSILON
+    # The linkage stays in the upper half plane it started in
+    assert b.y.value > 0 and c.y.value > 0
+
+def test_coincident():
+    (p1, p2, p3) = (features.Point(0, 0), features.Point(1, 1), features.Point(3, 5))
+    eqs = [
+        constraints.Coincident(p1, p2),
+        constraints.FixedX(p1, 2),
+        constraints.FixedDistance(p2, p3, 5),
+    ]
+    solver.solve(eqs)
+    assert (p1.x.value, p1.y.value) == (p2.x.value, p2.y.value)
+    assert p1.x.value == 2
+    assert residuals(eqs) <= solver.EPSILON
+
+def test_circles():
+    (p1, p2) = (features.Point(0, 0), features.Point(10, 1))
+    l = features.Line(p1, p2)
+    c1 = features.Circle(features.Point(3, 4), features.Scalar(2))
+    c2 = features.Circle(features.Point(5, 5), features.Scalar(1))
+    eqs = [
+        constraints.Horizontal(l),
+        constraints.Tangent(l, c1),
+        constraints.Concentric(c1, c2),
+        constraints.EqualRadius(c1, c2),
+        constraints.PointOnCircle(p2, c1),
+    ]
+    solver.solve(eqs)
+    assert residuals(eqs) <= solver.EPSILON
+    assert c1.center.x.value == c2.center.x.value
+    assert c1.radius.var.value == c2.radius.var.value
+
+def test_under_constrained():
+    # Free geometry converges and unconstrained variables are left alone
+    (points, lines) = polyline((0, 0), (3, 1), (1, 4))
+    eqs = [constraints.FixedDistance(points[0], points[1], 5)]
+    solver.solve(eqs)
+    assert residuals(eqs) <= solver.EPSILON
+    assert (points[2].x.value, points[2].y.value) == (1, 4)
+
+def test_over_constrained_consistent():
+    (points, eqs) = rectangle(0, 0, 3, 4)
+    eqs.append(constraints.FixedDistance(points[2], points[3], 3))
+    eqs.append(constraints.Parallel(features.Line(points[0], points[1]), features.Line(points[3], points[2])))
+    solver.solve(eqs)
+    assert residuals(eqs) <= solver.EPSILON
+
+def test_over_constrained_inconsistent():
+    (points, eqs) = rectangle(0, 0, 3, 4)
+    eqs.append(constraints.FixedDistance(points[0], points[2], 6))
+    with pytest.raises(solver.SolverException):
+        solver.solve(eqs)
+
+def test_conflicting_fixed():
+    p = features.Point(0, 0)
+    with pytest.raises(solver.SolverException):
+        solver.solve([constraints.FixedX(p, 1), constraints.FixedX(p, 2)])
+
+def test_deleted_coincident_releases_points():
+    (p1, p2) = (features.Point(0, 0), features.Point(4, 0))
+    coincident = constraints.Coincident(p1, p2)
+    eqs = [coincident, constraints.FixedX(p1, 0)]
+    solver.solve(eqs)
+    assert p2.x.value == 0
+    eqs.remove(coincident)
+    p2.x.value = 4
+    solver.solve(eqs)
+    assert p2.x.value == 4
+
+# Recorded budgets for solving sketches with the given number of variables:
+# (seconds, peak megabytes). These are generous multiples of the measured
+# cost so that only real regressions trip them.
+# A grid of independent rectangles, which splits into many small components:
+BUDGETS = {
+    1000: (0.5, 2.),
+    10000: (5., 16.),
+    100000: (60., 160.),
+}
+
+# A single chain, which is one large component and so exercises the dense
+# per-component linear algebra:
+CHAIN_BUDGETS = {
+    1000: (1., 64.),
+    2000: (4., 256.),
+}
+
+def rectangles(n_variables):
+    # Each rectangle has 4 points, so 8 variables
+    eqs = []
+    for i in range(n_variables // 8):
+        eqs += rectangle((i % 100) * 10, (i // 100) * 10, 5, 3)[1]
+    return eqs
+
+def chain(n_variables):
+    # Points at fixed x, joined by unit distances, starting off their solution.
+    # Only the first y is fixed, so every other y is one connected unknown.
+    points = [features.Point(i * 0.8, 0.6 * (i % 2) + 0.05 * np.sin(i)) for i in range(n_variables // 2)]
+    eqs = [constraints.FixedY(points[0], 0)]
+    eqs += [constraints.FixedX(p, i * 0.8) for (i, p) in enumerate(points)]
+    eqs += [constraints.FixedDistance(p, q, 1) for (p, q) in zip(points, points[1:])]
+    return eqs
+
+def check_budget(sketch, seconds, megabytes):
+    eqs = sketch()
+    start = time.perf_counter()
+    solver.solve(eqs)
+    elapsed = time.perf_counter() - start
+    assert residuals(eqs) <= solver.EPSILON
+    assert elapsed < seconds, "solve took {:.2f}s, budget is {:.2f}s".format(elapsed, seconds)
+
+    # Memory is measured on a separate run, since tracing slows the solve down
+    eqs = sketch()
+    tracemalloc.start()
+    try:
+        solver.solve(eqs)
+        (_, peak) = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak / 2 ** 20 < megabytes, "solve used {:.1f}MB, budget is {:.1f}MB".format(peak / 2 ** 20, megabytes)
+
+@pytest.mark.parametrize("n_variables", sorted(BUDGETS))
+def test_scaling(n_variables):
+    check_budget(lambda: rectangles(n_variables), *BUDGETS[n_variables])
+
+@pytest.mark.parametrize("n_variables", sorted(CHAIN_BUDGETS))
+def test_scaling_connected(n_variables):
+    assert len(solver.System(chain(n_variables)).components) == 1
+    check_budget(lambda: chain(n_variables), *CHAIN_BUDGETS[n_variables])
+
+def test_weighted_drag_keeps_dragged_point():
+    (a, b, c) = (features.Point(0, 0), features.Point(3, 0), features.Point(3, 4))
+    eqs = [constraints.FixedDistance(a, b, 3), constraints.FixedDistance(b, c, 4)]
+
+    # Drag c, and the rest of the chain should follow with as little movement as possible
+    (c.x.value, c.y.value) = (4, 4)
+    solver.solve(eqs, weights={c.x: 1e6, c.y: 1e6})
+    assert residuals(eqs) <= solver.EPSILON
+    assert np.allclose((c.x.value, c.y.value), (4, 4), atol=1e-4)
+    assert np.hypot(a.x.value, a.y.value) < 1
+
+def test_weighted_solve_differs_from_unweighted():
+    # In one component, the plain min-norm step pulls a dragged point back
+    # part of the way, while the weighted step holds it and moves the rest
+    def drag(weighted):
+        (a, b, c) = (features.Point(0, 0), features.Point(3, 0), features.Point(3, 4))
+        eqs = [constraints.FixedDistance(a, b, 3), constraints.FixedDistance(b, c, 4)]
+        (c.x.value, c.y.value) = (4, 4)
+        solver.solve(eqs, weights={c.x: 1e6, c.y: 1e6} if weighted else None)
+        assert residuals(eqs) <= solver.EPSILON
+        return (np.hypot(a.x.value, a.y.value), np.hypot(c.x.value - 4, c.y.value - 4))
+
+    (a_plain, c_plain) = drag(False)
+    (a_weighted, c_weighted) = drag(True)
+    assert c_plain > 1e-2 and c_weighted < 1e-6
+    assert a_weighted > 1.5 * a_plain
+
+def elbow(x, y):
+    # A two-link arm from the origin, with its end fixed at (x, y) and its elbow above
+    (a, b, c) = (features.Point(0, 0), features.Point(-1, 3), features.Point(x, y))
+    eqs = [
+        constraints.FixedX(a, 0), constraints.FixedY(a, 0),
+        constraints.FixedX(c, x), constraints.FixedY(c, y),
+        constraints.FixedDistance(a, b, 3),
+        constraints.FixedDistance(b, c, 4),
+    ]
+    solver.solve(eqs)
+    return ((a, b, c), eqs)
+
+def elbow_side(b, c):
+    return np.sign(c.x.value * b.y.value - c.y.value * b.x.value)
+
+@pytest.mark.parametrize("continuation", (False, True))
+def test_continuation_converges(continuation):
+    ((a, b, c), eqs) = elbow(5.25, -1.32)
+    (eqs[2].val, eqs[3].val) = (3.93, 2.88)
+    solver.solve(eqs, continuation=continuation)
+    assert residuals(eqs) <= solver.EPSILON
+    assert (c.x.value, c.y.value) == (3.93, 2.88)
+
+def test_continuation_keeps_branch():
+    # A large move of the end that makes a plain Newton solve flip the elbow
+    ((a, b, c), eqs) = elbow(5.25, -1.32)
+    side = elbow_side(b, c)
+    (eqs[2].val, eqs[3].val) = (3.93, 2.88)
+    solver.solve(eqs, continuation=True)
+    assert elbow_side(b, c) == side
+
+def test_continuation_falls_back_to_newton():
+    # The straight path of the end passes within reach 1 of the base, which the
+    # arm cannot reach, so continuation fails partway and plain Newton takes over
+    ((a, b, c), eqs) = elbow(5, 0)
+    (eqs[2].val, eqs[3].val) = (-5, 0.1)
+    solver.solve(eqs, continuation=True)
+    assert residuals(eqs) <= solver.EPSILON
+    assert (c.x.value, c.y.value) == (-5, 0.1)
+
+@pytest.mark.parametrize("shape", ((3, 7), (7, 3), (5, 5)))
+def test_min_norm_solve_matches_pinv(shape):
+    rng = np.random.default_rng(0)
+    component = solver.Component([], solver.Aliases(), {}, set())
+    A = rng.normal(size=shape)
+    b = rng.normal(size=shape[0])
+    assert np.allclose(component.min_norm_solve(A, b), np.dot(np.linalg.pinv(A), b))
+    assert component.full_rank
+
+def test_cholesky_solve():
+    rng = np.random.default_rng(0)
+    A = rng.normal(size=(6, 6))
+    normal = np.dot(A, A.T) + np.eye(6)
+    b = rng.normal(size=6)
+    assert np.allclose(solver.cholesky_solve(np.linalg.cholesky(normal), b), np.linalg.solve(normal, b))
+
+def test_min_norm_solve_rank_deficient():
+    rng = np.random.default_rng(0)
+    component = solver.Component([], solver.Aliases(), {}, set())
+    A = rng.normal(size=(4, 6))
+    A[3] = A[0] + A[1]
+    b = rng.normal(size=4)
+    assert np.allclose(component.min_norm_solve(A, b), np.dot(np.linalg.pinv(A), b))
+    assert component.full_rank is False
+
+def test_jacobian_sums_aliased_columns():
+    # Coincident and Horizontal alias variables; the reduced Jacobian must
+    # match substituting unknowns into the full one
+    (p1, p2, p3, p4) = (features.Point(0, 0), features.Point(1, 1), features.Point(3, 5), features.Point(4, 2))
+    eqs = [
+        constraints.Coincident(p1, p2),
+        constraints.Horizontal(p3, p4),
+        constraints.FixedX(p4, 4),
+        constraints.FixedDistance(p1, p3, 5),
+        constraints.FixedDistance(p2, p4, 3),
+    ]
+    (component,) = solver.System(eqs).components
+    roots = component.unknowns + component.constants
+    substitution = np.eye(len(roots))[component.root_index][:, :len(component.unknowns)]
+    x = np.arange(len(component.unknowns), dtype=float)
+    constants = np.array([7.] * len(component.constants))
+    xv = np.hstack((x, constants))[component.root_index]
+    J = np.vstack([df_e(xv) for df_e in component.dfs])
+    assert np.allclose(component.df(x, constants), np.dot(J, substitution))
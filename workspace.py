@@ -0,0 +1,54 @@
+import collections
+import concurrent.futures
+import os
+
+# Upper bound on the memory held by render caches across all open scenes
+MEMORY_BUDGET = 256 * 2 ** 20
+
+class Workspace:
+    # Shared state for every open scene: one bounded pool of solver workers,
+    # and one memory budget. When the budget is exceeded, the caches of the
+    # least recently active scenes are evicted and rebuilt when next shown.
+
+    def __init__(self, max_workers=None, memory_budget=MEMORY_BUDGET):
+        if max_workers is None:
+            max_workers = min(4, os.cpu_count() or 1)
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        self.memory_budget = memory_budget
+        # Least recently active first
+        self.canvases = collections.OrderedDict()
+        self.active = None
+
+    def add(self, canvas):
+        self.canvases[canvas] = None
+
+    def remove(self, canvas):
+        self.canvases.pop(canvas, None)
+        if self.active is canvas:
+            self.active = None
+
+    def activate(self, canvas):
+        self.canvases.move_to_end(canvas)
+        self.active = canvas
+        self.enforce_budget()
+
+    def submit(self, scene, weights=None, continuation=False):
+        # Solve a scene in the pool, returning a Future. The caller must not
+        # change the scene's values until it is done, or submit another
+        # solve of the same scene before then.
+        return self.pool.submit(scene.system().solve, weights, continuation)
+
+    def memory(self):
+        return sum(c.render_cache.nbytes for c in self.canvases if c.render_cache is not None)
+
+    def enforce_budget(self):
+        used = self.memory()
+        for canvas in list(self.canvases):
+            if used <= self.memory_budget:
+                break
+            if canvas is not self.active and canvas.render_cache is not None:
+                used -= canvas.render_cache.nbytes
+                canvas.evict()
+
+    def shutdown(self):
+        self.pool.shutdown()